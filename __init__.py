@@ -3,7 +3,7 @@ from pathlib import Path
 import settings
 from typing import Any, ClassVar, Mapping
 
-from BaseClasses import Item, Tutorial
+from BaseClasses import CollectionState, Item, Tutorial
 from Options import OptionError
 from worlds.AutoWorld import WebWorld, World
 
@@ -12,8 +12,9 @@ from .data import Passage, data_path
 from .items import ItemType, WL4Item, ap_id_from_wl4_data, filter_item_names, filter_items, item_table
 from .locations import get_level_locations, location_name_to_id
 from .options import Difficulty, Goal, GoldenJewels, PoolJewels, WL4Options, wl4_option_groups
-from .regions import connect_regions, create_regions
-from .rom import MD5_JP, MD5_US_EU, WL4ProcedurePatch, write_tokens
+from .regions import RegionGraph, connect_regions, create_regions
+from .rom import MD5_JP, MD5_US_EU, SHUFFLE_SEED_FILE, WL4ProcedurePatch, write_tokens
+from .rules import update_derived_items
 
 
 class WL4Settings(settings.Group):
@@ -23,8 +24,16 @@ class WL4Settings(settings.Group):
         copy_to = 'Wario Land 4.gba'
         md5s = [MD5_US_EU, MD5_JP]
 
+    class PatchedRomCacheSize(int):
+        """
+        Megabytes of patched ROMs to keep, so opening the same patch again
+        copies the ROM made last time instead of patching it again.
+        0 turns this off.
+        """
+
     rom_file: RomFile = RomFile(RomFile.copy_to)
     rom_start: bool = True
+    patched_rom_cache_size: PatchedRomCacheSize = PatchedRomCacheSize(0)
 
 
 class WL4Web(WebWorld):
@@ -121,6 +130,7 @@ class WL4World(World):
     TRAPS = ('Wario Form Trap', 'Lightning Trap')
 
     filler_item_weights: tuple[int, ...]
+    region_graph: RegionGraph | None = None
 
     def generate_early(self):
         if self.options.goal in (Goal.option_local_golden_treasure_hunt, Goal.option_local_golden_diva_treasure_hunt):
@@ -148,6 +158,7 @@ class WL4World(World):
     def create_regions(self):
         create_regions(self)
         connect_regions(self)
+        self.region_graph = RegionGraph(self)
 
     def create_items(self):
         difficulty = self.options.difficulty.value
@@ -216,6 +227,7 @@ class WL4World(World):
         patch = WL4ProcedurePatch(player=self.player, player_name=self.player_name)
         patch.write_file('basepatch.bsdiff', data_path('basepatch.bsdiff'))
         write_tokens(self, patch)
+        patch.write_file(SHUFFLE_SEED_FILE, self.random.getrandbits(32).to_bytes(4, 'little'))
         patch.procedure.append((
             'shuffle_music_and_wario_voice',
             [self.options.music_shuffle.value, self.options.wario_voice_shuffle.value]
@@ -247,3 +259,15 @@ class WL4World(World):
     def set_rules(self):
         self.multiworld.completion_condition[self.player] = (
             lambda state: state.has('Escape the Pyramid', self.player))
+
+    def collect(self, state: CollectionState, item: Item) -> bool:
+        change = super().collect(state, item)
+        if change:
+            update_derived_items(state.prog_items[self.player], item.name)
+        return change
+
+    def remove(self, state: CollectionState, item: Item) -> bool:
+        change = super().remove(state, item)
+        if change:
+            update_derived_items(state.prog_items[self.player], item.name)
+        return change
@@ -2,15 +2,17 @@ from __future__ import annotations
 
 import functools
 import struct
-from typing import TYPE_CHECKING
+import time
+from typing import Any, Awaitable, Callable, Container, NamedTuple, Optional, Sequence, TYPE_CHECKING
 
 import Utils
 from NetUtils import ClientStatus
 import worlds._bizhawk as bizhawk
 from worlds._bizhawk.client import BizHawkClient
 
+from .client_stats import ClientStats
 from .data import ItemFlag, Passage, encode_str, get_symbol
-from .locations import get_level_locations, location_name_to_id, location_table
+from .locations import level_location_bits
 
 if TYPE_CHECKING:
     from worlds._bizhawk.context import BizHawkClientContext, BizHawkContext
@@ -56,6 +58,23 @@ TRACKER_EVENT_FLAGS = [
 ]
 
 
+def _get_tracker_event_masks() -> tuple[int, ...]:
+    masks = [0] * (len(Passage) * 6)
+    event_bit = 1
+    for i, name in enumerate(LEVEL_CLEAR_FLAGS):
+        if name is None:
+            continue
+        passage, level = divmod(i, 5)
+        masks[passage * 6 + level] = event_bit
+        event_bit <<= 1
+    return tuple(masks)
+
+
+# Tracker event bit for each level status word, set when that level's Keyzer is
+# collected. Levels that aren't tracked have a mask of 0.
+TRACKER_EVENT_MASKS = _get_tracker_event_masks()
+
+
 main_game_mode_address = get_symbol('GlobalGameMode')
 sub_game_mode_address = get_symbol('sGameSeq')
 wario_freeze_timer_address = get_symbol('usWarStopFlg')
@@ -77,6 +96,7 @@ BOSS_LEVEL = 4
 GAMEMODE_TITLE_CUTSCENE = 0
 GAMEMODE_SELECT = 1
 GAMEMODE_INGAME = 2
+ALL_GAMEMODES = (GAMEMODE_TITLE_CUTSCENE, GAMEMODE_SELECT, GAMEMODE_INGAME)
 
 SELECT_PASSAGE = 2
 INGAME_WARIOCONTROL = 2
@@ -92,6 +112,17 @@ MULTIWORLD_IDLE = 0
 MULTIWORLD_ITEM_QUEUED = 1
 SEND_IMMEDIATELY = 1
 
+# Seconds between game watcher ticks, depending on how much is going on
+POLL_INTERVAL_ACTIVE = 0.125
+POLL_INTERVAL_DEFAULT = 0.5
+POLL_INTERVAL_IDLE = 1.0
+
+# Polls to wait for the game to take one item, and for a whole catch-up tick,
+# so a long backlog doesn't hold up the other handlers
+CATCH_UP_MAX_POLLS = 30
+CATCH_UP_MAX_TICK_POLLS = 60
+CATCH_UP_REPORT_THRESHOLD = 10
+
 
 def read(address: int, length: int, *, align: int = 1):
     assert address % align == 0, f'address: 0x{address:07x}, align: {align}'
@@ -125,6 +156,56 @@ guard16 = write16
 get_int = functools.partial(int.from_bytes, byteorder='little')
 
 
+class GameSnapshot(NamedTuple):
+    """Everything the handlers need from the game on one tick, read together so
+    that it all comes from the same frame."""
+
+    game_mode: tuple[int, int]
+    passage: int
+    level: int
+    room: int
+    collected_items: int
+    item_status: bytes
+    wario_health: int
+    timer_status: int
+    multiworld_state: int
+    send_immediately: int
+
+    @property
+    def received_item_count(self) -> int:
+        offset = received_item_count_address - inventory_address
+        return get_int(self.item_status[offset:offset + 2])
+
+    def level_status(self, passage: int, level: int) -> int:
+        offset = 4 * (6 * passage + level)
+        return get_int(self.item_status[offset:offset + 4])
+
+
+snapshot_reads = [
+    read16(main_game_mode_address),
+    read16(sub_game_mode_address),
+    read8(passage_address),
+    read8(level_address),
+    read8(room_address),
+    read32(collected_items_address),
+    read(inventory_address, len(Passage) * 6 * 4, align=4),
+    read8(wario_health_address),
+    read8(timer_status_address),
+    read8(multiworld_state_address),
+    read8(multiworld_send_address),
+]
+
+
+class ScheduledHandler(NamedTuple):
+    handler: Callable[[WL4Client, BizHawkClientContext, GameSnapshot], Awaitable[None]]
+    modes: Container[int]  # Main game modes where this handler does anything
+    interval: float = 0  # Minimum seconds between runs
+
+
+def encode_player_name(name: str) -> bytes:
+    return encode_str(name) + b'\xFE'
+
+
 def cmd_toggle_deathlink(self):
     """Toggle death link from client. Overrides default setting."""
 
@@ -136,6 +217,25 @@ def cmd_toggle_deathlink(self):
         name='Update Death Link'
     )
 
+def cmd_wl4stats(self, path: str = '', interval: str = ''):
+    """Print client performance stats. With a file name, also write them there
+    as JSON every 60 seconds or the given interval; 'off' stops writing."""
+    from CommonClient import logger
+
+    stats = self.ctx.client_handler.stats
+    logger.info(stats.summary())
+    if path == 'off':
+        stats.stop_dumping()
+        logger.info('Stopped writing client stats.')
+    elif path:
+        try:
+            dump_interval = float(interval) if interval else ClientStats.DEFAULT_DUMP_INTERVAL
+        except ValueError:
+            logger.info(f'Invalid interval: {interval}')
+            return
+        stats.start_dumping(path, dump_interval)
+        logger.info(f'Writing client stats to {path} every {dump_interval:g} seconds.')
+
 def cmd_receive_death(self):
     """Debug tool: Send a death to the game to test death link is working."""
     client_handler = self.ctx.client_handler
@@ -163,10 +263,18 @@ class WL4Client(BizHawkClient):
     game = 'Wario Land 4'
     system = 'GBA'
     patch_suffix = '.apwl4'
+    level_locations: list[dict[int, int]]
+    encoded_player_names: dict[int, bytes]
     local_checked_locations: set[int]
+    local_item_status: bytes
+    local_level_status: list[int]
+    local_collection: Optional[tuple[int, int, int]]
     local_hinted_locations: set[int]
-    local_set_events: dict[str, bool]
+    local_tracker_events: int
     local_room: int
+    item_backlog: int
+    handler_last_run: dict[str, float]
+    stats: ClientStats
     rom_slot_name: str | None
 
     death_link: DeathLinkCtx
@@ -175,10 +283,18 @@ class WL4Client(BizHawkClient):
 
     def __init__(self):
         super().__init__()
-        self.local_checked_locations = []
+        self.level_locations = [{} for _ in range(len(Passage) * 6)]
+        self.encoded_player_names = {}
+        self.local_checked_locations = set()
+        self.local_item_status = b''
+        self.local_level_status = [0] * (len(Passage) * 6)
+        self.local_collection = None
         self.local_hinted_locations = set()
-        self.local_set_events = {}
+        self.local_tracker_events = 0
         self.local_room = TRACKER_ROOM_NONE
+        self.item_backlog = 0
+        self.handler_last_run = {}
+        self.stats = ClientStats()
         self.rom_slot_name = None
         self.death_link = DeathLinkCtx()
 
@@ -230,6 +346,7 @@ class WL4Client(BizHawkClient):
             return False
 
         client_ctx.command_processor.commands['deathlink'] = cmd_toggle_deathlink
+        client_ctx.command_processor.commands['wl4stats'] = cmd_wl4stats
         # client_ctx.command_processor.commands['kill'] = cmd_receive_death
 
         self.dc_pending = False
@@ -239,15 +356,68 @@ class WL4Client(BizHawkClient):
     async def set_auth(self, client_ctx: BizHawkClientContext):
         client_ctx.auth = self.rom_slot_name
 
-    async def get_game_mode(self, bizhawk_ctx: BizHawkContext) -> tuple[int, int]:
-        read_result = await bizhawk.read(
+    async def bizhawk_read(self, bizhawk_ctx: BizHawkContext, reads: Sequence[tuple[int, int, str]]) -> list[bytes]:
+        self.stats.record_request('read', sum(length for _, length, _ in reads))
+        return await bizhawk.read(bizhawk_ctx, reads)
+
+    async def bizhawk_guarded_read(self,
+                                   bizhawk_ctx: BizHawkContext,
+                                   reads: Sequence[tuple[int, int, str]],
+                                   guards: Sequence[tuple[int, bytes, str]]) -> Optional[list[bytes]]:
+        result = await bizhawk.guarded_read(bizhawk_ctx, reads, guards)
+        self.stats.record_request('guarded_read', sum(length for _, length, _ in reads), result is not None)
+        return result
+
+    async def bizhawk_guarded_write(self,
+                                    bizhawk_ctx: BizHawkContext,
+                                    writes: Sequence[tuple[int, bytes, str]],
+                                    guards: Sequence[tuple[int, bytes, str]]) -> bool:
+        result = await bizhawk.guarded_write(bizhawk_ctx, writes, guards)
+        self.stats.record_request('guarded_write', sum(len(value) for _, value, _ in writes), result)
+        return result
+
+    async def send_msgs(self, client_ctx: BizHawkClientContext, msgs: list[dict[str, Any]]):
+        self.stats.record_messages(msgs)
+        await client_ctx.send_msgs(msgs)
+
+    async def send_death(self, client_ctx: BizHawkClientContext, death_text: str = ''):
+        """Like CommonContext.send_death, but through send_msgs so it shows up in the stats."""
+        from CommonClient import logger
+
+        if not (client_ctx.server and client_ctx.server.socket):
+            return
+        logger.info('DeathLink: Sending death to your friends...')
+        client_ctx.last_death_link = time.time()
+        await self.send_msgs(client_ctx, [{
+            'cmd': 'Bounce',
+            'tags': ['DeathLink'],
+            'data': {
+                'time': client_ctx.last_death_link,
+                'source': client_ctx.player_names[client_ctx.slot],
+                'cause': death_text,
+            }
+        }])
+
+    async def read_snapshot(self, bizhawk_ctx: BizHawkContext) -> GameSnapshot:
+        # The connector services a whole request in one frame, so the game mode
+        # read here is guaranteed to match the rest of the snapshot.
+        (main, sub, passage, level, room, collected_items, item_status,
+         wario_health, timer_status, multiworld_state, send_immediately) = await self.bizhawk_read(
             bizhawk_ctx,
-            [
-                read16(main_game_mode_address),
-                read16(sub_game_mode_address),
-            ]
+            snapshot_reads
+        )
+        return GameSnapshot(
+            (get_int(main), get_int(sub)),
+            get_int(passage),
+            get_int(level),
+            get_int(room),
+            get_int(collected_items),
+            bytes(item_status),
+            get_int(wario_health),
+            get_int(timer_status),
+            get_int(multiworld_state),
+            get_int(send_immediately),
         )
-        return tuple(map(get_int, read_result))
 
     @staticmethod
     def guard_game_mode(game_mode: tuple[int, int]):
@@ -256,139 +426,101 @@ class WL4Client(BizHawkClient):
             guard16(sub_game_mode_address, game_mode[1]),
         ]
 
-    @staticmethod
-    def get_collected_locations(client_ctx: BizHawkClientContext, passage: int, level: int, collection: int):
-        for location in get_level_locations(passage, level):
-            location_id = location_name_to_id[location]
-            if location_id not in client_ctx.server_locations:
-                continue
-
-            bit = location_table[location].flag
-            if collection & bit:
+    def get_collected_locations(self, passage: int, level: int, collection: int):
+        level_locations = self.level_locations[passage * 6 + level]
+        while collection:
+            bit = collection & -collection
+            collection ^= bit
+            location_id = level_locations.get(bit)
+            if location_id is not None:
                 yield location_id
 
-    async def handle_inventory(self, client_ctx: BizHawkClientContext):
-        bizhawk_ctx = client_ctx.bizhawk_ctx
-
-        main, _ = await self.get_game_mode(bizhawk_ctx)
+    async def handle_inventory(self, client_ctx: BizHawkClientContext, snapshot: GameSnapshot):
+        main, _ = snapshot.game_mode
         if main not in (GAMEMODE_SELECT, GAMEMODE_INGAME):
             return
 
-        inventory_result = await bizhawk.guarded_read(
-            bizhawk_ctx,
-            [read(inventory_address, len(Passage) * 6 * 4)],
-            [guard16(main_game_mode_address, main)],
-        )
-        collection_result = await bizhawk.guarded_read(
-            bizhawk_ctx,
-            [
-                read8(passage_address),
-                read8(level_address),
-                read32(collected_items_address),
-            ],
-            [
-                guard16(main_game_mode_address, main),
-                guard8(multiworld_send_address, SEND_IMMEDIATELY),
-            ]
-        )
+        collection = None
+        if snapshot.send_immediately == SEND_IMMEDIATELY and snapshot.level < BOSS_LEVEL:
+            collection = (snapshot.passage, snapshot.level, snapshot.collected_items)
 
-        if inventory_result is None:
+        # Usually nothing has changed since the last tick
+        item_status = snapshot.item_status
+        previous_status = self.local_item_status
+        if item_status == previous_status and collection == self.local_collection:
             return
-        inventory = struct.iter_unpack("<6I", inventory_result[0])
+        self.local_item_status = item_status
 
         locations: set[int] = set()
-        events: dict[str, bool] = {}
+        events = 0
 
-        for passage, levels in zip(Passage, inventory, strict=True):
-            for level, status_bits in enumerate(levels):
-                locations.update(self.get_collected_locations(client_ctx, passage, level, status_bits >> 8))
-                if level > 4:
-                    continue
-                level_name = LEVEL_CLEAR_FLAGS[passage * 5 + level]
-                if level_name:
-                    events[level_name] = bool(status_bits & ItemFlag.KEYZER)
-
-        if collection_result is not None:
-            passage, level, collection = map(get_int, collection_result)
-            if level < BOSS_LEVEL:
-                locations.update(self.get_collected_locations(client_ctx, passage, level, collection))
-
-        if self.local_checked_locations != locations:
-            self.local_checked_locations = locations
-            await client_ctx.send_msgs([{
+        for passage in Passage:
+            start = passage * 24
+            if item_status[start:start + 24] == previous_status[start:start + 24]:
+                continue
+            for level, status_bits in enumerate(struct.unpack_from("<6I", item_status, start)):
+                # Only decode the boxes that were opened since the last tick
+                index = passage * 6 + level
+                new_bits = status_bits & ~self.local_level_status[index]
+                self.local_level_status[index] = status_bits
+                if new_bits:
+                    locations.update(self.get_collected_locations(passage, level, new_bits >> 8))
+                if status_bits & ItemFlag.KEYZER:
+                    events |= TRACKER_EVENT_MASKS[index]
+
+        if collection is not None and collection != self.local_collection:
+            locations.update(self.get_collected_locations(*collection))
+        self.local_collection = collection
+
+        locations.difference_update(self.local_checked_locations)
+        if locations:
+            self.local_checked_locations.update(locations)
+            await self.send_msgs(client_ctx, [{
                 'cmd': 'LocationChecks',
                 'locations': locations
             }])
 
-        if self.local_set_events != events and client_ctx.slot is not None:
-            event_bitfield = 0
-            for i, flag in enumerate(TRACKER_EVENT_FLAGS):
-                if events[flag]:
-                    event_bitfield |= 1 << i
-            await client_ctx.send_msgs([{
+        # The server ORs the events in, so there's only something to send when a new bit is set
+        if events & ~self.local_tracker_events and client_ctx.slot is not None:
+            await self.send_msgs(client_ctx, [{
                 'cmd': 'Set',
                 'key': f'wl4_events_{client_ctx.team}_{client_ctx.slot}',
                 'default': 0,
                 'want_reply': False,
-                'operations': [{'operation': 'or', 'value': event_bitfield}]
+                'operations': [{'operation': 'or', 'value': events}]
             }])
-            self.local_set_events = events
-
-    async def handle_hints(self, client_ctx: BizHawkClientContext):
-        bizhawk_ctx = client_ctx.bizhawk_ctx
+            self.local_tracker_events |= events
 
-        game_mode = await self.get_game_mode(bizhawk_ctx)
-        main, sub = game_mode
+    async def handle_hints(self, client_ctx: BizHawkClientContext, snapshot: GameSnapshot):
+        main, sub = snapshot.game_mode
         if main != GAMEMODE_SELECT or sub not in SELECT_EJECTION_STATES:
             return
-
-        read_result = await bizhawk.guarded_read(
-            bizhawk_ctx,
-            [
-                read8(passage_address),
-                read8(level_address),
-                read32(collected_items_address),
-            ],
-            [
-                *self.guard_game_mode(game_mode),
-                guard8(multiworld_send_address, False)
-            ]
-        )
-        if read_result is None:
+        if snapshot.send_immediately:
             return
 
-        passage, level, collection = map(get_int, read_result)
-        locations: set[int] = set(self.get_collected_locations(client_ctx, passage, level, collection))
+        locations: set[int] = set(self.get_collected_locations(
+            snapshot.passage, snapshot.level, snapshot.collected_items))
 
         locations.difference_update(self.local_checked_locations)
         locations.difference_update(self.local_hinted_locations)
         if locations:
             self.local_hinted_locations.update(locations)
-            await client_ctx.send_msgs([{
+            await self.send_msgs(client_ctx, [{
                 'cmd': 'LocationScouts',
                 'locations': locations,
                 'create_as_hint': CREATE_HINT_ONLY_NEW
             }])
 
-    async def handle_current_room(self, client_ctx: BizHawkClientContext):
-        bizhawk_ctx = client_ctx.bizhawk_ctx
-
-        main, _ = await self.get_game_mode(bizhawk_ctx)
+    async def handle_current_room(self, client_ctx: BizHawkClientContext, snapshot: GameSnapshot):
+        main, _ = snapshot.game_mode
 
         if main == GAMEMODE_INGAME:
-            read_result = await bizhawk.read(bizhawk_ctx, [
-                read8(passage_address),
-                read8(level_address),
-                read8(room_address),
-            ])
-
-            passage, level, room = map(get_int, read_result)
-            current_room = passage << 16 | level << 8 | room
+            current_room = snapshot.passage << 16 | snapshot.level << 8 | snapshot.room
         else:
             current_room = TRACKER_ROOM_NONE
 
         if self.local_room != current_room and client_ctx.slot is not None:
-            await client_ctx.send_msgs([{
+            await self.send_msgs(client_ctx, [{
                 'cmd': 'Set',
                 'key': f'wl4_room_{client_ctx.team}_{client_ctx.slot}',
                 'default': TRACKER_ROOM_NONE,
@@ -397,33 +529,22 @@ class WL4Client(BizHawkClient):
             }])
             self.local_room = current_room
 
-    async def handle_goal(self, client_ctx: BizHawkClientContext):
+    async def handle_goal(self, client_ctx: BizHawkClientContext, snapshot: GameSnapshot):
         if client_ctx.finished_game:
             return
 
-        bizhawk_ctx = client_ctx.bizhawk_ctx
-
-        game_mode = await self.get_game_mode(bizhawk_ctx)
-        main, sub = game_mode
+        main, sub = snapshot.game_mode
         if main != GAMEMODE_INGAME:
             if main != GAMEMODE_TITLE_CUTSCENE or sub not in END_OF_GAME_CUTSCENE_STATES:
                 return
 
-        read_result = await bizhawk.guarded_read(
-            bizhawk_ctx,
-            [read32(inventory_address + 4 * (6 * Passage.GOLDEN + BOSS_LEVEL))],
-            self.guard_game_mode(game_mode)
-        )
-        if read_result is None:
-            return
-
-        if get_int(read_result[0]) & ItemFlag.DIVA_CLEAR:
-            await client_ctx.send_msgs([{
+        if snapshot.level_status(Passage.GOLDEN, BOSS_LEVEL) & ItemFlag.DIVA_CLEAR:
+            await self.send_msgs(client_ctx, [{
                 'cmd': 'StatusUpdate',
                 'status': ClientStatus.CLIENT_GOAL
             }])
 
-    async def handle_death_link(self, client_ctx: BizHawkClientContext):
+    async def handle_death_link(self, client_ctx: BizHawkClientContext, snapshot: GameSnapshot):
         if self.death_link.update_pending:
             await client_ctx.update_death_link(self.death_link.enabled)
             self.death_link.update_pending = False
@@ -433,33 +554,23 @@ class WL4Client(BizHawkClient):
 
         bizhawk_ctx = client_ctx.bizhawk_ctx
 
-        read_result = await bizhawk.guarded_read(
-            bizhawk_ctx,
-            [
-                read8(wario_health_address),
-                read8(timer_status_address),
-            ],
-            [
-                guard16(main_game_mode_address, GAMEMODE_INGAME),
-            ]
-        )
-        if read_result is None:
+        main, _ = snapshot.game_mode
+        if main != GAMEMODE_INGAME:
             return
 
-        wario_health, timer_status = map(get_int, read_result)
-        time_up = timer_status in range(4, 11)
+        time_up = snapshot.timer_status in range(4, 11)
 
-        if wario_health == 0 or time_up:
+        if snapshot.wario_health == 0 or time_up:
             self.death_link.pending = False
             if not self.death_link.sent_this_death:
                 self.death_link.sent_this_death = True
                 death_text = f'{client_ctx.auth} timed out' if time_up else ''
-                await client_ctx.send_death(death_text)
+                await self.send_death(client_ctx, death_text)
         else:
             self.death_link.sent_this_death = False
 
         if self.death_link.pending:
-            await bizhawk.guarded_write(
+            await self.bizhawk_guarded_write(
                 bizhawk_ctx,
                 [write8(wario_health_address, 0)],
                 [
@@ -469,27 +580,15 @@ class WL4Client(BizHawkClient):
             )
             self.death_link.sent_this_death = True
 
-    async def handle_received_items(self, client_ctx: BizHawkClientContext):
-        bizhawk_ctx = client_ctx.bizhawk_ctx
-
-        game_mode = await self.get_game_mode(bizhawk_ctx)
-        if game_mode not in ((GAMEMODE_SELECT, SELECT_PASSAGE), (GAMEMODE_INGAME, INGAME_WARIOCONTROL)):
-            return
-
-        read_result = await bizhawk.read(
-            bizhawk_ctx,
-            [read16(received_item_count_address)]
-        )
-
-        received_item_count = get_int(read_result[0])
-        if received_item_count >= len(client_ctx.items_received):
-            return
-
-        next_item = client_ctx.items_received[received_item_count]
+    async def queue_received_item(self, client_ctx: BizHawkClientContext, game_mode: tuple[int, int], index: int) -> bool:
+        next_item = client_ctx.items_received[index]
         next_item_id = next_item.item & 0xFF
-        next_item_sender = encode_str(client_ctx.player_names[next_item.player]) + b'\xFE'
-        await bizhawk.guarded_write(
-            bizhawk_ctx,
+        next_item_sender = self.encoded_player_names.get(next_item.player)
+        if next_item_sender is None:
+            next_item_sender = encode_player_name(client_ctx.player_names[next_item.player])
+            self.encoded_player_names[next_item.player] = next_item_sender
+        queued = await self.bizhawk_guarded_write(
+            client_ctx.bizhawk_ctx,
             [
                 write8(incoming_item_address, next_item_id),
                 write(item_sender_address, next_item_sender),
@@ -500,6 +599,83 @@ class WL4Client(BizHawkClient):
                 guard8(multiworld_state_address, MULTIWORLD_IDLE)
             ]
         )
+        if queued:
+            self.stats.record_item_delivered(index)
+        return queued
+
+    def report_item_backlog(self, backlog: int):
+        from CommonClient import logger
+
+        if backlog >= CATCH_UP_REPORT_THRESHOLD and self.item_backlog < CATCH_UP_REPORT_THRESHOLD:
+            logger.info(f'Catching up on {backlog} received items.')
+        elif backlog == 0 and self.item_backlog >= CATCH_UP_REPORT_THRESHOLD:
+            logger.info('Caught up on received items.')
+        self.item_backlog = backlog
+
+    async def handle_received_items(self, client_ctx: BizHawkClientContext, snapshot: GameSnapshot):
+        bizhawk_ctx = client_ctx.bizhawk_ctx
+
+        game_mode = snapshot.game_mode
+        if game_mode not in ((GAMEMODE_SELECT, SELECT_PASSAGE), (GAMEMODE_INGAME, INGAME_WARIOCONTROL)):
+            return
+
+        multiworld_state = snapshot.multiworld_state
+        received_item_count = snapshot.received_item_count
+        self.stats.record_received_count(received_item_count)
+        self.report_item_backlog(max(0, len(client_ctx.items_received) - received_item_count))
+
+        # With several items waiting, keep polling and hand over the next item
+        # as soon as the game accepts it instead of waiting for the next tick.
+        polls = 0
+        tick_polls = 0
+        while self.item_backlog:
+            if multiworld_state == MULTIWORLD_IDLE:
+                if not await self.queue_received_item(client_ctx, game_mode, received_item_count):
+                    return
+            if self.item_backlog == 1:
+                return
+
+            polls += 1
+            tick_polls += 1
+            if polls > CATCH_UP_MAX_POLLS or tick_polls > CATCH_UP_MAX_TICK_POLLS:
+                return
+            read_result = await self.bizhawk_guarded_read(
+                bizhawk_ctx,
+                [
+                    read8(multiworld_state_address),
+                    read16(received_item_count_address),
+                ],
+                self.guard_game_mode(game_mode)
+            )
+            if read_result is None:
+                return
+            multiworld_state, current_count = map(get_int, read_result)
+            if current_count != received_item_count:
+                received_item_count = current_count
+                polls = 0
+                self.stats.record_received_count(received_item_count)
+            self.report_item_backlog(max(0, len(client_ctx.items_received) - received_item_count))
+
+    handler_schedule = (
+        ScheduledHandler(handle_inventory, (GAMEMODE_SELECT, GAMEMODE_INGAME)),
+        ScheduledHandler(handle_hints, (GAMEMODE_SELECT,)),
+        ScheduledHandler(handle_current_room, ALL_GAMEMODES, interval=0.5),
+        ScheduledHandler(handle_received_items, (GAMEMODE_SELECT, GAMEMODE_INGAME)),
+        ScheduledHandler(handle_death_link, ALL_GAMEMODES),
+        ScheduledHandler(handle_goal, (GAMEMODE_TITLE_CUTSCENE, GAMEMODE_INGAME)),
+    )
+
+    def get_poll_interval(self, snapshot: GameSnapshot) -> float:
+        main, sub = snapshot.game_mode
+        if self.item_backlog:
+            return POLL_INTERVAL_ACTIVE
+        if main == GAMEMODE_INGAME and sub == INGAME_WARIOCONTROL:
+            return POLL_INTERVAL_ACTIVE
+        if main == GAMEMODE_SELECT and sub in SELECT_EJECTION_STATES:
+            return POLL_INTERVAL_ACTIVE
+        if main == GAMEMODE_TITLE_CUTSCENE and sub not in END_OF_GAME_CUTSCENE_STATES:
+            return POLL_INTERVAL_IDLE
+        return POLL_INTERVAL_DEFAULT
 
     async def game_watcher(self, client_ctx: BizHawkClientContext):
         if self.dc_pending:
@@ -507,21 +683,47 @@ class WL4Client(BizHawkClient):
             return
 
         try:
-            await self.handle_inventory(client_ctx)
-            await self.handle_hints(client_ctx)
-            await self.handle_current_room(client_ctx)
-            await self.handle_received_items(client_ctx)
-            await self.handle_death_link(client_ctx)
-            await self.handle_goal(client_ctx)
+            start = time.perf_counter()
+            snapshot = await self.read_snapshot(client_ctx.bizhawk_ctx)
+            self.stats.record_handler('read_snapshot', time.perf_counter() - start)
+            main, _ = snapshot.game_mode
+            now = time.monotonic()
+            for scheduled in self.handler_schedule:
+                if main not in scheduled.modes:
+                    continue
+                name = scheduled.handler.__name__
+                if scheduled.interval and now - self.handler_last_run.get(name, float('-inf')) < scheduled.interval:
+                    continue
+                self.handler_last_run[name] = now
+                start = time.perf_counter()
+                await scheduled.handler(self, client_ctx, snapshot)
+                self.stats.record_handler(name, time.perf_counter() - start)
         except bizhawk.RequestFailedError:
-            pass
+            return
+        finally:
+            self.stats.dump_if_due()
+
+        client_ctx.watcher_timeout = self.get_poll_interval(snapshot)
 
     def on_package(self, ctx: BizHawkClientContext, cmd: str, args: dict) -> None:
+        if cmd in ("Connected", "RoomUpdate") and "players" in args:
+            self.encoded_player_names = {slot: encode_player_name(name) for slot, name in ctx.player_names.items()}
         if cmd == "Connected":
-            self.local_checked_locations = []
+            self.level_locations = [
+                {bit: location_id
+                 for bit, location_id in level_location_bits.get(divmod(index, 6), ())
+                 if location_id in ctx.server_locations}
+                for index in range(len(Passage) * 6)
+            ]
+            self.local_checked_locations = set()
+            self.local_item_status = b''
+            self.local_level_status = [0] * (len(Passage) * 6)
+            self.local_collection = None
             self.local_hinted_locations = set()
-            self.local_set_events = {}
+            self.local_tracker_events = 0
             self.local_room = (1 << 24) - 1
+            self.handler_last_run = {}
+            self.item_backlog = 0
             if args["slot_data"].get("death_link"):
                 self.death_link.enabled = True
                 self.death_link.update_pending = True
@@ -529,6 +731,8 @@ class WL4Client(BizHawkClient):
             if ctx.seed_name and ctx.seed_name != args['seed_name']:
                 # CommonClient's on_package displays an error to the user in this case, but connection is not cancelled.
                 self.dc_pending = True
+        if cmd == 'ReceivedItems':
+            self.stats.record_items_received(args['index'], len(args['items']))
         if cmd == 'Bounced':
             tags = args.get('tags', [])
             if 'DeathLink' in tags and args['data']['source'] != ctx.auth:
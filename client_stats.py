@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from collections import Counter
+import json
+import time
+from typing import Any, Optional
+
+
+class TimingHistogram:
+    """Durations bucketed by powers of two, starting at 1/16 ms."""
+
+    BUCKET_BASE = 1 / 16000
+    BUCKET_COUNT = 20
+
+    buckets: list[int]
+    count: int
+    total: float
+    max: float
+
+    def __init__(self):
+        self.buckets = [0] * self.BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        bucket = min(int(seconds / self.BUCKET_BASE).bit_length(), self.BUCKET_COUNT - 1)
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> str:
+        return f'{self.count} samples, mean {1000 * self.mean():.2f} ms, max {1000 * self.max:.2f} ms'
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'count': self.count,
+            'total_seconds': self.total,
+            'max_seconds': self.max,
+            # Upper bound of each bucket in seconds
+            'buckets': {f'{self.BUCKET_BASE * (1 << i):.6g}': n
+                        for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class ClientStats:
+    """Counters for the client's hot paths, printed by /wl4stats."""
+
+    DEFAULT_DUMP_INTERVAL = 60.0
+
+    handler_times: dict[str, TimingHistogram]
+    requests: Counter[str]
+    request_bytes: Counter[str]
+    guard_failures: Counter[str]
+    messages_sent: Counter[str]
+    delivery_latency: TimingHistogram
+    item_received_times: dict[int, float]
+    received_count: int
+
+    dump_path: Optional[str]
+    dump_interval: float
+    last_dump: float
+
+    def __init__(self):
+        self.start_time = time.monotonic()
+        self.handler_times = {}
+        self.requests = Counter()
+        self.request_bytes = Counter()
+        self.guard_failures = Counter()
+        self.messages_sent = Counter()
+        self.delivery_latency = TimingHistogram()
+        self.item_received_times = {}
+        self.received_count = 0
+        self.dump_path = None
+        self.dump_interval = self.DEFAULT_DUMP_INTERVAL
+        self.last_dump = 0.0
+
+    def record_handler(self, name: str, seconds: float):
+        histogram = self.handler_times.get(name)
+        if histogram is None:
+            histogram = self.handler_times[name] = TimingHistogram()
+        histogram.add(seconds)
+
+    def record_request(self, kind: str, size: int, passed: bool = True):
+        self.requests[kind] += 1
+        self.request_bytes[kind] += size
+        if not passed:
+            self.guard_failures[kind] += 1
+
+    def record_messages(self, msgs: list[dict[str, Any]]):
+        for msg in msgs:
+            self.messages_sent[msg['cmd']] += 1
+
+    def record_items_received(self, first_index: int, count: int):
+        now = time.monotonic()
+        # The server resends every item on reconnect, but the game already has some
+        for index in range(max(first_index, self.received_count), first_index + count):
+            self.item_received_times.setdefault(index, now)
+
+    def record_received_count(self, count: int):
+        """Forget the items the game already has, however they got there."""
+        if count == self.received_count:
+            return
+        self.received_count = count
+        for index in [index for index in self.item_received_times if index < count]:
+            del self.item_received_times[index]
+
+    def record_item_delivered(self, index: int):
+        received_time = self.item_received_times.pop(index, None)
+        if received_time is not None:
+            self.delivery_latency.add(time.monotonic() - received_time)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            'uptime_seconds': time.monotonic() - self.start_time,
+            'handler_times': {name: histogram.as_dict() for name, histogram in self.handler_times.items()},
+            'bizhawk_requests': dict(self.requests),
+            'bizhawk_request_bytes': dict(self.request_bytes),
+            'guard_failures': dict(self.guard_failures),
+            'messages_sent': dict(self.messages_sent),
+            'item_delivery_latency': self.delivery_latency.as_dict(),
+        }
+
+    def summary(self) -> str:
+        uptime = time.monotonic() - self.start_time
+        lines = [f'Client stats over {uptime:.0f} s:', 'Handler times:']
+        for name, histogram in self.handler_times.items():
+            lines.append(f'  {name}: {histogram.summary()}')
+        lines.append('BizHawk requests:')
+        for kind, count in self.requests.items():
+            lines.append(f'  {kind}: {count} ({self.request_bytes[kind]} bytes, '
+                         f'{self.guard_failures[kind]} guard failures)')
+        lines.append('Messages sent: ' + (', '.join(f'{cmd} {count}' for cmd, count in self.messages_sent.items())
+                                          or 'none'))
+        lines.append(f'Item delivery latency: {self.delivery_latency.summary()}')
+        return '\n'.join(lines)
+
+    def start_dumping(self, path: str, interval: float):
+        self.dump_path = path
+        self.dump_interval = interval
+        self.last_dump = 0.0
+
+    def stop_dumping(self):
+        self.dump_path = None
+
+    def dump_if_due(self):
+        if self.dump_path is None:
+            return
+        now = time.monotonic()
+        if now - self.last_dump < self.dump_interval:
+            return
+        self.last_dump = now
+        try:
+            with open(self.dump_path, 'w') as stream:
+                json.dump(self.as_dict(), stream, indent=2)
+        except OSError as error:
+            from CommonClient import logger
+
+            logger.error(f'Could not write client stats to {self.dump_path}: {error}')
+            self.stop_dumping()
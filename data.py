@@ -103,8 +103,18 @@ def _get_charset() -> Mapping[str, int]:
     return charset
 
 
+class _CharsetTable(dict):
+    """Maps code points to Wario Land 4 characters for str.translate. The
+    results are all below 256, so the translated string encodes to the game's
+    bytes as Latin-1."""
+
+    def __missing__(self, codepoint: int) -> int:
+        return 0xFF
+
+
 symbols = _get_symbols()
 charset = _get_charset()
+_charset_table = _CharsetTable({ord(character): byte for character, byte in charset.items() if len(character) == 1})
 
 
 def get_symbol(symbol: str, offset: int = 0) -> int:
@@ -117,7 +127,4 @@ def encode_str(msg: str) -> bytes:
     """Encode a string into Wario Land 4's text format. Unrecognized characters
     are converted to spaces."""
 
-    encoded = []
-    for c in msg:
-        encoded.append(charset.get(c, 0xFF))
-    return bytes(encoded)
+    return msg.translate(_charset_table).encode('latin-1')
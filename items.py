@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from enum import IntEnum
-from typing import Any, Iterable, NamedTuple, Optional, Tuple, Union
+from typing import Any, Iterable, Mapping, NamedTuple, Optional, Tuple, Union
 
 from BaseClasses import Item, ItemClassification as IC
 
@@ -85,38 +85,10 @@ def ap_id_from_wl4_data(data: ItemData) -> int:
 
 
 def wl4_data_from_ap_id(ap_id: int) -> Tuple[str, ItemData]:
-    val = ap_id - ap_id_offset
-    if val >> 6 == 0:
-        passage = (val & 0x1C) >> 2
-        if val >> 5 == 0:
-            quad = val & 3
-            candidates = tuple(filter(lambda d: d[1][0] == ItemType.JEWEL and
-                                                d[1][1][0] == passage and
-                                                d[1][1][1] == quad,
-                                      item_table.items()))
-        else:
-            level = val & 3
-            candidates = tuple(filter(lambda d: d[1][0] == ItemType.CD and
-                                                d[1][1] == (passage, level),
-                                      item_table.items()))
-    elif val >> 3 == 8:
-        candidates = tuple(filter(lambda d: d[1][0] == ItemType.ABILITY and
-                                            d[1][1] == val,
-                                  item_table.items()))
-    elif val >> 4 == 7:
-        candidates = tuple(filter(lambda d: d[1][0] == ItemType.TREASURE and
-                                            d[1][1] == val,
-                                  item_table.items()))
-    elif val >> 4 == 8:
-        candidates = tuple(filter(lambda d: d[1][0] == ItemType.ITEM and
-                                            d[1][1] == val,
-                                  item_table.items()))
-    else:
-        candidates = ()
-
-    if not candidates:
+    item = items_by_ap_id.get(ap_id)
+    if item is None:
         raise ValueError(f'Could not find WL4 item ID: {ap_id}')
-    return candidates[0]
+    return item
 
 
 class WL4Item(Item):
@@ -232,6 +204,10 @@ item_table = {
     'Diamond':                          ItemData(ItemType.ITEM,     0x85,                              IC.filler),
 }
 
+items_by_ap_id: Mapping[int, Tuple[str, ItemData]] = {
+    ap_id_from_wl4_data(data): (name, data) for name, data in item_table.items()
+}
+
 
 def filter_items(*, type: Optional[ItemType] = None, passage: Optional[Passage] = None) -> Iterable[Tuple[str, ItemData]]:
     items: Iterable[Tuple[str, ItemData]] = item_table.items()
@@ -1,4 +1,4 @@
-from typing import NamedTuple, Optional, Sequence
+from typing import Mapping, NamedTuple, Optional, Sequence, Tuple
 
 from BaseClasses import Location, Region
 
@@ -377,8 +377,26 @@ class WL4Location(Location):
             return None
         return (self.passage * 5 + self.level) * (len(ItemFlag) - 1)
 
-def get_level_locations(passage: Passage, level: int):
-    return map(lambda l: l[0], get_level_location_data(passage, level))
+
+def _get_level_location_index() -> Mapping[Tuple[int, int], Tuple[str, ...]]:
+    index = {}
+    for name, data in location_table.items():
+        index.setdefault(data.level_id(), []).append(name)
+    return {level_id: tuple(names) for level_id, names in index.items()}
+
+
+# Location names and (bit, AP ID) pairs for each level, in location_table order.
+# Locations that only exist on some difficulties share bits, so the client
+# narrows the bit tables down to the locations in the seed once it connects.
+level_location_names = _get_level_location_index()
+level_location_bits = {
+    level_id: tuple((int(location_table[name].flag), location_name_to_id[name]) for name in names)
+    for level_id, names in level_location_names.items()
+}
+
+
+def get_level_locations(passage: Passage, level: int) -> Tuple[str, ...]:
+    return level_location_names.get((passage, level), ())
 
 def get_level_location_data(passage: Passage, level: int):
-    return filter(lambda l: l[1].level_id() == (passage, level), location_table.items())
+    return ((name, location_table[name]) for name in get_level_locations(passage, level))
@@ -1,16 +1,17 @@
 from __future__ import annotations
 
+from collections import deque
 import itertools
-from typing import Optional, TYPE_CHECKING
+from typing import Container, Iterable, NamedTuple, Optional, Sequence, TYPE_CHECKING
 
 from worlds.generic.Rules import CollectionRule, add_rule, add_item_rule
-from BaseClasses import Item, Location, Region, Entrance
+from BaseClasses import CollectionState, Entrance, Location, MultiWorld, Region
 
 from .data import Passage
-from .items import ItemType, WL4Item, filter_item_names, wl4_data_from_ap_id
+from .items import ItemType, WL4Item, ap_id_from_wl4_data, filter_item_names, filter_items
 from .locations import WL4Location
 from .region_data import LocationData, passage_levels, level_table, passage_boss_table, golden_diva
-from .rules import Requirement, has, has_all, has_treasures
+from .rules import Requirement, has, has_all, has_treasures, uses_only_abilities
 from .options import OpenDoors, Portal
 
 if TYPE_CHECKING:
@@ -24,6 +25,117 @@ class WL4Region(Region):
     def __init__(self, name: str, world: WL4World):
         super().__init__(name, world.player, world.multiworld)
 
+    def can_reach(self, state: CollectionState) -> bool:
+        if state.stale[self.player]:
+            region_graph = self.multiworld.worlds[self.player].region_graph
+            if region_graph is None:
+                state.update_reachable_regions(self.player)
+            else:
+                region_graph.update_reachable_regions(state)
+        return self in state.reachable_regions[self.player]
+
+
+class RegionGraph:
+    """A player's regions as indices with adjacency arrays, for updating a
+    stale state's reachable regions as a bitset instead of going through each
+    Entrance's and Region's can_reach. This fills in the same bookkeeping as
+    CollectionState.update_reachable_regions and follows exits in the same
+    order, so paths in the spoiler match."""
+
+    player: int
+    multiworld: MultiWorld
+    regions: list[Region]
+    region_bits: dict[Region, int]
+    origin: int
+    # Every exit is numbered, and these are indexed by that number
+    entrances: list[Entrance]
+    edge_targets: list[int]
+    edge_ids: dict[Entrance, int]
+    region_edges: list[tuple[int, ...]]  # Exit numbers of each region
+    indirect_count: int
+    use_fallback: bool
+
+    def __init__(self, world: WL4World):
+        self.player = world.player
+        self.multiworld = world.multiworld
+        self.regions = list(world.multiworld.get_regions(world.player))
+        region_indices = {region: i for i, region in enumerate(self.regions)}
+        self.region_bits = {region: 1 << i for region, i in region_indices.items()}
+        self.origin = region_indices[world.get_region(world.origin_region_name)]
+
+        self.entrances = [entrance for region in self.regions for entrance in region.exits]
+        self.edge_ids = {entrance: i for i, entrance in enumerate(self.entrances)}
+        self.edge_targets = [region_indices.get(entrance.connected_region, -1) for entrance in self.entrances]
+        self.region_edges = [tuple(self.edge_ids[entrance] for entrance in region.exits) for region in self.regions]
+
+        # Leave anything this doesn't handle to the generic update
+        self.use_fallback = -1 in self.edge_targets
+        self.indirect_count = -1
+        self.check_graph()
+
+    def check_graph(self):
+        """Switch to the generic update if indirect conditions or exits were
+        added to these regions after the graph was built."""
+        indirect_connections = self.multiworld.indirect_connections
+        if len(indirect_connections) != self.indirect_count:
+            self.indirect_count = len(indirect_connections)
+            if any(region in indirect_connections for region in self.regions):
+                self.use_fallback = True
+        if len(self.edge_ids) != sum(len(region.exits) for region in self.regions):
+            self.use_fallback = True
+
+    def update_reachable_regions(self, state: CollectionState):
+        player = self.player
+        self.check_graph()
+        if self.use_fallback:
+            state.update_reachable_regions(player)
+            return
+
+        reachable_regions = state.reachable_regions[player]
+        blocked_connections = state.blocked_connections[player]
+        edge_ids = self.edge_ids
+        if not all(entrance in edge_ids for entrance in blocked_connections):
+            # Something outside this graph was marked reachable
+            state.update_reachable_regions(player)
+            return
+
+        state.stale[player] = False
+        path = state.path
+        regions = self.regions
+        entrances = self.entrances
+        edge_targets = self.edge_targets
+        region_edges = self.region_edges
+
+        reachable = 0
+        for region in reachable_regions:
+            reachable |= self.region_bits.get(region, 0)
+        queue = deque(edge_ids[entrance] for entrance in blocked_connections)
+        if not reachable >> self.origin & 1:
+            origin = regions[self.origin]
+            reachable_regions.add(origin)
+            reachable |= 1 << self.origin
+            blocked_connections.update(origin.exits)
+            queue.extend(region_edges[self.origin])
+
+        while queue:
+            edge = queue.popleft()
+            target = edge_targets[edge]
+            if reachable >> target & 1:
+                blocked_connections.discard(entrances[edge])
+                continue
+            entrance = entrances[edge]
+            if entrance.access_rule(state):
+                target_region = regions[target]
+                if not entrance.hide_path and entrance not in path:
+                    parent = entrance.parent_region
+                    path[entrance] = (entrance.name, path.get(parent, (parent.name, None)))
+                reachable_regions.add(target_region)
+                reachable |= 1 << target
+                blocked_connections.discard(entrance)
+                blocked_connections.update(target_region.exits)
+                queue.extend(region_edges[target])
+                path[target_region] = (target_region.name, path.get(entrance))
+
 
 def get_region_name(level: str, region: Optional[str]):
     return level if region is None else f'{level} - {region}'
@@ -42,42 +154,144 @@ def create_event(region: Region, location_name: str, item_name: str = None):
     return location
 
 
-def create_regions(world: WL4World):
-    def can_escape(level):
-        return lambda state: state.can_reach_location(f'{level} - Frog Switch', world.player)
-
-    def restrict_jewel_piece_on_boss(passage: Passage):
-        def rule(item: Item):
-            if item.player != world.player:
-                return True
-            _, item_data = wl4_data_from_ap_id(item.code)
-            return item_data.type != ItemType.JEWEL or item_data.passage() != passage
-        return rule
-
-    def restrict_jewel_piece_in_golden_passage(item: Item):
-        if item.player != world.player:
-            return True
-        _, item_data = wl4_data_from_ap_id(item.code)
-        return item_data.type != ItemType.JEWEL or item_data.passage() == Passage.GOLDEN
+# The levels' regions only depend on a few options, so every world with the
+# same values for them builds its levels from the same layout.
 
-    regions = []
+class LocationTemplate(NamedTuple):
+    name: str
+    event_item: Optional[str]
+    access_rule: Optional[Requirement]  # Options already folded
 
-    pyramid = WL4Region("Pyramid", world)
-    regions.append(pyramid)
 
-    for passage in Passage:
-        regions.append(WL4Region(passage.long_name(), world))
+class RegionTemplate(NamedTuple):
+    level: str
+    name: str
+    locations: Sequence[LocationTemplate]
+
+
+class ExitTemplate(NamedTuple):
+    name: str
+    source: str
+    destination: str
+    access_rule: Optional[Requirement]  # Options already folded
+
+
+class LevelLayout(NamedTuple):
+    regions: Sequence[RegionTemplate]
+    exits: Sequence[ExitTemplate]
+
+
+def get_layout_key(world: WL4World):
+    # Level rules only check the difficulty and logic options
+    return (
+        world.options.difficulty.value,
+        world.options.logic.value,
+        world.options.diamond_shuffle.value,
+        world.options.portal.value,
+        world.options.open_doors.value,
+    )
 
+
+def _fold_rule(world: WL4World, rule: Optional[Requirement]) -> Optional[Requirement]:
+    if rule is None:
+        return None
+    rule = rule.fold_options(world)
+    return None if rule.is_always(True) else rule
+
+
+def _all_of(rules: Iterable[Optional[Requirement]]) -> Optional[Requirement]:
+    combined = None
+    for rule in rules:
+        if rule is not None:
+            combined = rule if combined is None else combined & rule
+    return combined
+
+
+def _any_of(rules: Iterable[Optional[Requirement]]) -> Optional[Requirement]:
+    combined = None
+    for rule in rules:
+        if rule is None:
+            return None
+        combined = rule if combined is None else combined | rule
+    return combined
+
+
+def _is_ability_exit(exit_template: ExitTemplate) -> bool:
+    return exit_template.access_rule is None or uses_only_abilities(exit_template.access_rule.node)
+
+
+def _get_downstream_regions(exits: Sequence[ExitTemplate], starts: Iterable[str]) -> set[str]:
+    found = set(starts)
+    queue = deque(found)
+    while queue:
+        region = queue.popleft()
+        for exit_template in exits:
+            if exit_template.source == region and exit_template.destination not in found:
+                found.add(exit_template.destination)
+                queue.append(exit_template.destination)
+    return found
+
+
+def _collapse_level(root: str, regions: dict[str, list[LocationTemplate]],
+                    exits: Sequence[ExitTemplate]) -> tuple[dict[str, list[LocationTemplate]], list[ExitTemplate]]:
+    """Merge the regions only reached through ability checks into the level's
+    root region. Each merged region's locations and exits get the Or of every
+    path to it from the root, each path being the And of its exits' rules."""
+
+    # A region can only be merged if every way into it is merged too
+    kept = (regions.keys() - _get_downstream_regions(exits, [root])) | _get_downstream_regions(
+        exits, [exit_template.destination for exit_template in exits if not _is_ability_exit(exit_template)])
+    if root in kept:
+        return regions, list(exits)
+    merged = regions.keys() - kept
+
+    paths: dict[str, list[Optional[Requirement]]] = {root: [None]}
+    def visit(region: str, visited: frozenset[str], path: tuple[Optional[Requirement], ...]):
+        for exit_template in exits:
+            destination = exit_template.destination
+            if exit_template.source != region or destination not in merged or destination in visited:
+                continue
+            next_path = path + (exit_template.access_rule,)
+            paths.setdefault(destination, []).append(_all_of(next_path))
+            visit(destination, visited | {destination}, next_path)
+    visit(root, frozenset([root]), ())
+    path_rules = {region: _any_of(rules) for region, rules in paths.items()}
+
+    collapsed_regions = {root: []}
+    for name, locations in regions.items():
+        if name in merged:
+            collapsed_regions[root].extend(
+                location._replace(access_rule=_all_of((path_rules[name], location.access_rule)))
+                for location in locations
+            )
+        else:
+            collapsed_regions[name] = locations
+
+    collapsed_exits = []
+    for exit_template in exits:
+        if exit_template.source not in merged:
+            collapsed_exits.append(exit_template)
+        elif exit_template.destination not in merged:
+            collapsed_exits.append(exit_template._replace(
+                source=root,
+                access_rule=_all_of((path_rules[exit_template.source], exit_template.access_rule))
+            ))
+
+    return collapsed_regions, collapsed_exits
+
+
+def _build_level_layout(world: WL4World) -> LevelLayout:
+    regions = []
+    exits = []
     for level_name, level_data in level_table.items():
+        level_regions: dict[str, list[LocationTemplate]] = {}
         for region_data in level_data.regions:
-            region_name = get_region_name(level_name, region_data.name)
-            region = WL4Region(region_name, world)
-
             locations: list[LocationData] = []
             locations.extend(region_data.locations)
             if (world.options.diamond_shuffle.value):
                locations.extend(region_data.diamonds)
 
+            location_templates = []
             for location_data in locations:
                 if world.options.difficulty.value not in location_data.difficulties:
                     continue
@@ -89,27 +303,94 @@ def create_regions(world: WL4World):
                     if level_name != "Golden Passage":
                         continue
 
-                location_name = f'{level_name} - {location_data.name}'
-                if location_data.event:
-                    item_name = f'{location_data.name} ({level_name})'
-                    location = create_event(region, location_name, item_name)
-                else:
-                    location = WL4Location(world.player, location_name, region)
-
-                if location_data.access_rule is not None:
-                    add_rule(location, location_data.access_rule.apply_world(world))
+                access_rule = location_data.access_rule
                 if world.options.portal.value == Portal.option_vanilla and location_data.name != "Frog Switch":
-                    add_rule(location, can_escape(level_name))
-                if world.options.restrict_self_locking_jewel_pieces.value and level_name == "Golden Passage":
-                    add_item_rule(location, restrict_jewel_piece_in_golden_passage)
+                    # Escaping means having hit the level's frog switch, which is an event
+                    can_escape = has(f'Frog Switch ({level_name})')
+                    access_rule = can_escape if access_rule is None else access_rule & can_escape
+
+                location_templates.append(LocationTemplate(
+                    f'{level_name} - {location_data.name}',
+                    f'{location_data.name} ({level_name})' if location_data.event else None,
+                    _fold_rule(world, access_rule)
+                ))
+            level_regions[get_region_name(level_name, region_data.name)] = location_templates
+
+        level_exits = []
+        for region_data in level_data.regions:
+            for exit_data in region_data.exits:
+                access_rule = _fold_rule(world, exit_data.access_rule)
+                # Leave out connections that can never be taken with these options
+                if access_rule is not None and access_rule.is_always(False):
+                    continue
+                level_exits.append(ExitTemplate(
+                    f'{level_name} - {region_data.name or "Main area"} to {exit_data.destination or "Main area"}',
+                    get_region_name(level_name, region_data.name),
+                    get_region_name(level_name, exit_data.destination),
+                    access_rule
+                ))
 
-                region.locations.append(location)
-            regions.append(region)
+        level_regions, level_exits = _collapse_level(get_level_entrance_name(level_name), level_regions, level_exits)
+        regions.extend(RegionTemplate(level_name, name, tuple(locations)) for name, locations in level_regions.items())
+        exits.extend(level_exits)
+
+    return LevelLayout(tuple(regions), tuple(exits))
+
+
+_level_layouts: dict[tuple, LevelLayout] = {}
+
+def get_level_layout(world: WL4World) -> LevelLayout:
+    key = get_layout_key(world)
+    layout = _level_layouts.get(key)
+    if layout is None:
+        layout = _level_layouts[key] = _build_level_layout(world)
+    return layout
+
+
+def get_jewel_piece_codes(passages: Container[Passage]) -> frozenset[int]:
+    return frozenset(ap_id_from_wl4_data(data) for _, data in filter_items(type=ItemType.JEWEL)
+                     if data.passage() in passages)
+
+
+def create_regions(world: WL4World):
+    def forbid_own_items(codes: frozenset[int]):
+        player = world.player
+        return lambda item: item.player != player or item.code not in codes
+
+    # Jewel pieces that would lock themselves behind the place they're found
+    restrict_jewel_piece_in_golden_passage = forbid_own_items(
+        get_jewel_piece_codes([passage for passage in Passage if passage != Passage.GOLDEN]))
+    restrict_jewel_piece_on_boss = {
+        passage: forbid_own_items(get_jewel_piece_codes([passage])) for passage in passage_boss_table
+    }
+
+    regions = []
+
+    pyramid = WL4Region("Pyramid", world)
+    regions.append(pyramid)
+
+    for passage in Passage:
+        regions.append(WL4Region(passage.long_name(), world))
+
+    restrict_golden_passage = world.options.restrict_self_locking_jewel_pieces.value
+    for region_template in get_level_layout(world).regions:
+        region = WL4Region(region_template.name, world)
+        for location_template in region_template.locations:
+            if location_template.event_item is not None:
+                location = create_event(region, location_template.name, location_template.event_item)
+            else:
+                location = WL4Location(world.player, location_template.name, region)
+            if location_template.access_rule is not None:
+                add_rule(location, location_template.access_rule.apply_world(world))
+            if restrict_golden_passage and region_template.level == "Golden Passage":
+                add_item_rule(location, restrict_jewel_piece_in_golden_passage)
+            region.locations.append(location)
+        regions.append(region)
 
     for passage, boss_data in passage_boss_table.items():
         boss_region = WL4Region(f'{passage.long_name()} Boss', world)
         location = create_event(boss_region, boss_data.name, f'{passage.long_name()} Clear')
-        add_rule(location, boss_data.kill_rule.apply_world(world))
+        add_requirement(world, location, boss_data.kill_rule)
         boss_region.locations.append(location)
         regions.append(boss_region)
 
@@ -118,7 +399,7 @@ def create_regions(world: WL4World):
             for time in ('15', '35', '55'):
                 location = WL4Location(world.player, f'{boss_data.name} - 0:{time}', prize_region)
                 if world.options.restrict_self_locking_jewel_pieces.value:
-                    add_item_rule(location, restrict_jewel_piece_on_boss(passage))
+                    add_item_rule(location, restrict_jewel_piece_on_boss[passage])
                 prize_region.locations.append(location)
             regions.append(prize_region)
 
@@ -126,7 +407,7 @@ def create_regions(world: WL4World):
     if world.options.goal.needs_diva():
         diva_location = create_event(golden_diva_region, golden_diva.name, 'Escape the Pyramid')
         golden_diva_region.locations.append(diva_location)
-        add_rule(diva_location, golden_diva.kill_rule.apply_world(world))
+        add_requirement(world, diva_location, golden_diva.kill_rule)
         if (world.options.goal.needs_treasure_hunt()):
             add_rule(diva_location, has_treasures().apply_world(world))
     regions.append(golden_diva_region)
@@ -180,19 +461,8 @@ def connect_regions(world: WL4World):
         lambda state: state.has_all(['Emerald Passage Clear', 'Ruby Passage Clear', 'Topaz Passage Clear', 'Sapphire Passage Clear'], world.player)
     )
 
-    for level_name, level_data in level_table.items():
-        for region_data in level_data.regions:
-            source = get_region_name(level_name, region_data.name)
-            for exit_data in region_data.exits:
-                destination = get_region_name(level_name, exit_data.destination)
-
-                connect_entrance(
-                    world,
-                    f'{level_name} - {region_data.name or "Main area"} to {exit_data.destination or "Main area"}',
-                    source,
-                    destination,
-                    exit_data.access_rule
-                )
+    for exit_template in get_level_layout(world).exits:
+        connect_entrance(world, *exit_template)
 
     if (world.options.goal.needs_treasure_hunt()):
         for passage, boss_data in passage_boss_table.items():
@@ -205,13 +475,22 @@ def connect_regions(world: WL4World):
             )
 
 
+def add_requirement(world: WL4World, spot: Location | Entrance, rule: Requirement):
+    rule = rule.fold_options(world)
+    if not rule.is_always(True):
+        add_rule(spot, rule.apply_world(world))
+
+
 def connect_entrance(world: WL4World, name: str, source: str, target: str, rule: Requirement | None = None):
+    if rule is not None:
+        rule = rule.fold_options(world)
+
     source_region = world.get_region(source)
     target_region = world.get_region(target)
 
     connection = Entrance(world.player, name, source_region)
 
-    if rule:
+    if rule is not None and not rule.is_always(True):
         connection.access_rule = rule.apply_world(world)
 
     source_region.exits.append(connection)
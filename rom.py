@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import hashlib
 import itertools
+import logging
+import os
 import random
 from pathlib import Path
 import struct
-from typing import Dict, List, NamedTuple, Optional, TYPE_CHECKING
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union, TYPE_CHECKING
 
 import Utils
 from worlds.Files import APPatchExtension, APProcedurePatch, APTokenMixin, APTokenTypes
@@ -12,6 +15,7 @@ from worlds.Files import APPatchExtension, APProcedurePatch, APTokenMixin, APTok
 from .data import Passage, ap_id_offset, encode_str, get_symbol
 from .items import ItemType, WL4Item, filter_items
 from .options import Difficulty, Goal, MusicShuffle, OpenDoors, Portal, SmashThroughHardBlocks
+from .rom_cache import PatchedRomCache
 
 if TYPE_CHECKING:
     from . import WL4World
@@ -22,6 +26,10 @@ if TYPE_CHECKING:
 MD5_US_EU = '5fe47355a33e3fabec2a1607af88a404'
 MD5_JP = '99c8ad779a16be513a9fdff502b6f5c2'
 
+# Seed for the music and voice shuffle. It's kept in its own file instead of
+# the procedure's arguments, so older clients can still apply the patch.
+SHUFFLE_SEED_FILE = 'shuffle_seed.bin'
+
 
 def get_rom_address(name, offset=0):
     address = get_symbol(name, offset)
@@ -38,12 +46,27 @@ def patch_instructions(patch: WL4ProcedurePatch, address: int, *instructions: in
     )
 
 
+def get_rom_buffer(rom: bytes | bytearray) -> bytearray:
+    # AP's steps hand over bytes. Copy those once, and after that every WL4
+    # step edits and returns the same bytearray.
+    return rom if isinstance(rom, bytearray) else bytearray(rom)
+
+
+def _shift_medal_color(color: int) -> int:
+    # The medal tiles only use colors 0-5, which move up to 10-15
+    return (color + 10) & 0xF if color != 0 else 0
+
+
+# Maps each byte of 4bpp tile data to the coin palette, both pixels at once
+medal_palette_shift = bytes(_shift_medal_color(byte >> 4) << 4 | _shift_medal_color(byte & 0xF) for byte in range(256))
+
+
 class WL4PatchExtensions(APPatchExtension):
     game = 'Wario Land 4'
 
     @staticmethod
-    def update_header(caller: APProcedurePatch, rom: bytes) -> bytes:
-        rombuffer = bytearray(rom)
+    def update_header(caller: APProcedurePatch, rom: bytes | bytearray) -> bytearray:
+        rombuffer = get_rom_buffer(rom)
 
         # Change game name
         game_name = rombuffer[0xA0:0xAC].decode('ascii')
@@ -56,37 +79,58 @@ class WL4PatchExtensions(APPatchExtension):
         rombuffer[0xA0:0xAC] = game_name.encode('ascii')
 
         # Recalculate checksum
-        checksum = 0
-        for i in range(0xA0, 0xBD):
-            checksum -= rombuffer[i]
-        checksum -= 0x19
+        checksum = -sum(rombuffer[0xA0:0xBD]) - 0x19
         rombuffer[0xBD] = checksum & 0xFF
 
-        return bytes(rombuffer)
+        return rombuffer
 
     @staticmethod
-    def shuffle_music_and_wario_voice(caller: APProcedurePatch, rom: bytes, music: int, voices: int) -> bytes:
+    def shuffle_music_and_wario_voice(caller: APProcedurePatch, rom: bytes | bytearray,
+                                      music: int, voices: int) -> bytearray:
+        # Patches made before the seed was added shuffle differently every time
+        seed = caller.files.get(SHUFFLE_SEED_FILE)
+        shuffle_random = random.Random(None if seed is None else int.from_bytes(seed, 'little'))
         local_rom = LocalRom(rom)
-        shuffle_music(local_rom, music)
-        shuffle_wario_voice_sets(local_rom, voices)
-        return bytes(local_rom)
+        shuffle_music(local_rom, music, shuffle_random)
+        shuffle_wario_voice_sets(local_rom, voices, shuffle_random)
+        return local_rom.buffer
 
     @staticmethod
-    def copy_medal_gfx(caller: APProcedurePatch, rom: bytes) -> bytes:
+    def copy_medal_gfx(caller: APProcedurePatch, rom: bytes | bytearray) -> bytearray:
         local_rom = LocalRom(rom)
         top_tiles = local_rom.read_bytes(0x6E561C + 32 * 645, 32 * 2)
         bottom_tiles = local_rom.read_bytes(0x6E561C + 32 * 677, 32 * 2)
-        tiles = bytearray()
-        for tile in top_tiles + bottom_tiles:
-            upper = tile & 0xF0
-            lower = tile & 0x0F
-            if upper != 0:
-                upper += 10 << 4
-            if lower != 0:
-                lower += 10
-            tiles.append(upper | lower)
+        tiles = (top_tiles + bottom_tiles).translate(medal_palette_shift)
         local_rom.write_bytes(get_rom_address("MinigameCoinTiles"), tiles)
-        return bytes(local_rom)
+        return local_rom.buffer
+
+
+def merge_writes(writes: Sequence[Tuple[int, bytes]]) -> List[Tuple[int, bytes]]:
+    """Combine writes that touch or overlap into one block each, keeping the
+    bytes the last write to each address would have left."""
+    blocks = []
+    group: List[int] = []
+    group_end = 0
+    for index in sorted(range(len(writes)), key=lambda i: writes[i][0]):
+        address, data = writes[index]
+        if group and address > group_end:
+            blocks.append(_merge_group(writes, group))
+            group = []
+        group_end = max(group_end, address + len(data)) if group else address + len(data)
+        group.append(index)
+    if group:
+        blocks.append(_merge_group(writes, group))
+    return blocks
+
+
+def _merge_group(writes: Sequence[Tuple[int, bytes]], group: List[int]) -> Tuple[int, bytes]:
+    start = min(writes[index][0] for index in group)
+    end = max(writes[index][0] + len(writes[index][1]) for index in group)
+    block = bytearray(end - start)
+    for index in sorted(group):
+        address, data = writes[index]
+        block[address - start:address - start + len(data)] = data
+    return start, bytes(block)
 
 
 class WL4ProcedurePatch(APProcedurePatch, APTokenMixin):
@@ -95,6 +139,13 @@ class WL4ProcedurePatch(APProcedurePatch, APTokenMixin):
     patch_file_ending = '.apwl4'
     result_file_ending = '.gba'
 
+    # Bump whenever a patch step changes the ROM it makes, so that ROMs cached
+    # by older clients aren't reused
+    steps_version = 1
+
+    # Writes are held back and merged into as few tokens as possible
+    pending_writes: List[Tuple[int, bytes]]
+
     def __init__(self, *args, **kwargs):
         super(WL4ProcedurePatch, self).__init__(*args, **kwargs)
         self.procedure = [
@@ -103,11 +154,61 @@ class WL4ProcedurePatch(APProcedurePatch, APTokenMixin):
             ('update_header', []),
             ('copy_medal_gfx', []),
         ]
+        self.pending_writes = []
+
+    def write_token(self, token_type: APTokenTypes, offset: int, data: Union[bytes, Tuple[int, int], int]):
+        if token_type == APTokenTypes.WRITE:
+            self.pending_writes.append((offset, bytes(data)))
+            return
+        # Other tokens apply in order with the writes, so they can't be merged across
+        self.flush_writes()
+        super().write_token(token_type, offset, data)
+
+    def flush_writes(self):
+        writes, self.pending_writes = self.pending_writes, []
+        for address, data in merge_writes(writes):
+            super().write_token(APTokenTypes.WRITE, address, data)
+
+    def get_token_binary(self) -> bytes:
+        self.flush_writes()
+        return super().get_token_binary()
+
+    def patch(self, target: str):
+        cache = get_patched_rom_cache()
+        if cache is None:
+            super().patch(target)
+            return
+
+        rom_path = get_base_rom_path()
+        key = cache.get_key(self.path, get_file_md5(rom_path, rom_path.stat()), str(self.steps_version))
+        # The cache only saves time, so patch normally if it can't be used
+        try:
+            cached = cache.get(key, target)
+        except OSError as error:
+            logging.warning(f'Could not read from the patched ROM cache: {error}')
+            cached = False
+        if cached:
+            # The server and slot to connect to still come from the patch file
+            self.read()
+            return
+        super().patch(target)
+        try:
+            cache.put(key, target)
+        except OSError as error:
+            logging.warning(f'Could not save the patched ROM to the cache: {error}')
 
     @classmethod
     def get_source_data(cls) -> bytes:
-        with open(get_base_rom_path(), 'rb') as stream:
-            return stream.read()
+        """Read the base ROM and check that it's a supported version. Patching
+        needs the whole ROM anyway, so a remembered hash only saves hashing it."""
+        rom_path = get_base_rom_path()
+        with open(rom_path, 'rb') as stream:
+            stat = os.fstat(stream.fileno())
+            rom = stream.read()
+        md5 = get_file_md5(rom_path, stat, rom)
+        if md5 not in (MD5_US_EU, MD5_JP):
+            raise ValueError(f'Base ROM {rom_path} is not a supported version of Wario Land 4 (MD5: {md5})')
+        return rom
 
 
 def get_base_rom_path(file_name: str = '') -> Path:
@@ -122,6 +223,30 @@ def get_base_rom_path(file_name: str = '') -> Path:
         return Path(Utils.user_path(file_name))
 
 
+def get_patched_rom_cache() -> Optional[PatchedRomCache]:
+    from . import WL4World
+    cache_size = WL4World.settings.patched_rom_cache_size
+    if not cache_size:
+        return None
+    return PatchedRomCache(Utils.cache_path('wl4', 'patched_roms'), cache_size * 1024 * 1024)
+
+
+def get_file_md5(path: Path, stat: os.stat_result, data: Optional[bytes] = None) -> str:
+    """Hash a file's contents, reusing the hash from an earlier run if the
+    file's size and modification time haven't changed since. The file is
+    only read if it needs hashing and its contents weren't passed in."""
+    key = str(path.resolve())
+    cached = Utils.persistent_load().get('wl4_rom_md5', {}).get(key)
+    if cached is not None and cached.get('size') == stat.st_size and cached.get('mtime') == stat.st_mtime_ns:
+        return cached['md5']
+
+    if data is None:
+        data = path.read_bytes()
+    md5 = hashlib.md5(data).hexdigest()
+    Utils.persistent_store('wl4_rom_md5', key, {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'md5': md5})
+    return md5
+
+
 def write_tokens(world: WL4World, patch: WL4ProcedurePatch):
     fill_items(world, patch)
 
@@ -451,8 +576,9 @@ def set_difficulty_level(patch: WL4ProcedurePatch, difficulty: Difficulty):
 
 
 class LocalRom():
-    def __init__(self, rom: bytes):
-        self.buffer = bytearray(rom)
+    def __init__(self, rom: bytes | bytearray):
+        # Edits a bytearray in place, so the caller's buffer sees the changes
+        self.buffer = get_rom_buffer(rom)
 
     def read_bit(self, address: int, bit_number: int) -> bool:
         bitflag = (1 << bit_number)
@@ -490,6 +616,42 @@ class LocalRom():
         word = value.to_bytes(4, 'little')
         self.write_bytes(address, word)
 
+    # Bulk accessors for tables of values `stride` bytes apart. Each byte lane
+    # of the values is copied with one extended slice instead of a loop.
+
+    def _read_values(self, address: int, count: int, stride: int, size: int, code: str) -> list[int]:
+        assert address % size == 0 and stride % size == 0, f'Misaligned table: {address:x}, stride {stride}'
+        if stride == size:
+            data = self.buffer[address:address + size * count]
+        else:
+            data = bytearray(size * count)
+            end = address + stride * (count - 1) + size
+            for lane in range(size):
+                data[lane::size] = self.buffer[address + lane:end:stride]
+        return list(struct.unpack(f'<{count}{code}', data))
+
+    def _write_values(self, address: int, values: Sequence[int], stride: int, size: int, code: str):
+        assert address % size == 0 and stride % size == 0, f'Misaligned table: {address:x}, stride {stride}'
+        data = struct.pack(f'<{len(values)}{code}', *values)
+        if stride == size:
+            self.write_bytes(address, data)
+        else:
+            end = address + stride * (len(values) - 1) + size
+            for lane in range(size):
+                self.buffer[address + lane:end:stride] = data[lane::size]
+
+    def read_halfwords(self, address: int, count: int, stride: int = 2) -> list[int]:
+        return self._read_values(address, count, stride, 2, 'H')
+
+    def read_words(self, address: int, count: int, stride: int = 4) -> list[int]:
+        return self._read_values(address, count, stride, 4, 'I')
+
+    def write_halfwords(self, address: int, values: Sequence[int], stride: int = 2):
+        self._write_values(address, values, stride, 2, 'H')
+
+    def write_words(self, address: int, values: Sequence[int], stride: int = 4):
+        self._write_values(address, values, stride, 4, 'I')
+
     def __bytes__(self):
         return bytes(self.buffer)
 
@@ -535,7 +697,7 @@ other_songs = [  # Not made to play in levels
 ]
 
 
-def shuffle_music(rom: LocalRom, music_shuffle: int):
+def shuffle_music(rom: LocalRom, music_shuffle: int, shuffle_random: random.Random):
     if music_shuffle == MusicShuffle.option_none:
         return
     # music_shuffle >= MusicShuffle.option_levels_only
@@ -547,22 +709,23 @@ def shuffle_music(rom: LocalRom, music_shuffle: int):
 
     music_table_address = 0x098028
     # Only change the header pointers; leave the music player numbers alone
-    music_info_table = [rom.read_word(music_table_address + 8 * i) for i in range(819)]
+    music_info_table = rom.read_words(music_table_address, 819, 8)
 
     if music_shuffle == MusicShuffle.option_disabled:
         shuffled_music = [0] * len(music_pool)
     else:
         shuffled_music = list(music_pool)
-        random.shuffle(shuffled_music)
+        shuffle_random.shuffle(shuffled_music)
+    new_music_info_table = list(music_info_table)
     for vanilla, shuffled in zip(music_pool, shuffled_music):
-        rom.write_word(music_table_address + 8 * vanilla, music_info_table[shuffled])
+        new_music_info_table[vanilla] = music_info_table[shuffled]
+    rom.write_words(music_table_address, new_music_info_table, 8)
 
     # Remove horizontal mixing in Palm Tree Paradise and Mystic Lake
 
     palm_tree_paradise_doors = range(0x3F30F0, 0x3F3240, 12)
     # Set most doors' music IDs to 0 (no change)
-    for addr in palm_tree_paradise_doors[1:23]:
-        rom.write_halfword(addr + 10, 0)
+    rom.write_halfwords(palm_tree_paradise_doors[1] + 10, [0] * 22, 12)
     # Set pink pipes to the same as the portal
     rom.write_halfword(palm_tree_paradise_doors[23] + 10, 0x28B)
     rom.write_halfword(palm_tree_paradise_doors[25] + 10, 0x28B)
@@ -571,24 +734,22 @@ def shuffle_music(rom: LocalRom, music_shuffle: int):
     rom.write_halfword(palm_tree_paradise_doors[24] + 10, 0x2A2)
 
     mystic_lake_doors = range(0x3F3420, 0x3F3570, 12)
-    for addr in mystic_lake_doors[1:23]:
-        rom.write_halfword(addr + 10, 0)
+    rom.write_halfwords(mystic_lake_doors[1] + 10, [0] * 22, 12)
     rom.write_halfword(mystic_lake_doors[23] + 10, 0x28F)
     rom.write_halfword(mystic_lake_doors[25] + 10, 0x28F)
     rom.write_halfword(mystic_lake_doors[26] + 10, 0x2A2)
 
 
-def shuffle_wario_voice_sets(rom: LocalRom, shuffle: int):
+def shuffle_wario_voice_sets(rom: LocalRom, shuffle: int, shuffle_random: random.Random):
     if not shuffle:
         return
 
     voice_set_pointer_address = 0x6D3648
-    voice_set_pointers = [rom.read_word(voice_set_pointer_address + 4 * i) for i in range(12)]
+    voice_set_pointers = rom.read_words(voice_set_pointer_address, 12)
     voice_set_length_address = 0x6D3394
-    voice_set_lengths = [rom.read_word(voice_set_length_address + 4 * i) for i in range(12)]
+    voice_set_lengths = rom.read_words(voice_set_length_address, 12)
     voice_sets = list(zip(voice_set_pointers, voice_set_lengths))
 
-    random.shuffle(voice_sets)
-    for i, (pointer, length) in enumerate(voice_sets):
-        rom.write_word(voice_set_pointer_address + 4 * i, pointer)
-        rom.write_word(voice_set_length_address + 4 * i, length)
+    shuffle_random.shuffle(voice_sets)
+    rom.write_words(voice_set_pointer_address, [pointer for pointer, _ in voice_sets])
+    rom.write_words(voice_set_length_address, [length for _, length in voice_sets])
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+import shutil
+import tempfile
+
+
+class PatchedRomCache:
+    """Patched ROMs saved by the hash of the patch file and base ROM they were
+    made from, and the version of the patch steps that made them. Patching has
+    to give the same ROM every time for this to be correct. When the directory
+    gets bigger than max_size bytes, the least recently used ROMs are deleted
+    first."""
+
+    directory: Path
+    max_size: int
+
+    def __init__(self, directory: str | Path, max_size: int):
+        self.directory = Path(directory)
+        self.max_size = max_size
+
+    @staticmethod
+    def get_key(patch_path: str | Path, base_rom_md5: str, steps_version: str) -> str:
+        digest = hashlib.sha256()
+        with open(patch_path, 'rb') as stream:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(base_rom_md5.encode('ascii'))
+        digest.update(steps_version.encode('ascii'))
+        return digest.hexdigest()
+
+    def get_path(self, key: str) -> Path:
+        return self.directory / f'{key}.gba'
+
+    def get(self, key: str, target: str | Path) -> bool:
+        """Copy the cached ROM to target, if there is one."""
+        path = self.get_path(key)
+        try:
+            shutil.copyfile(path, target)
+        except FileNotFoundError:
+            return False
+        # The modification time doubles as the last time the ROM was used
+        os.utime(path)
+        return True
+
+    def put(self, key: str, source: str | Path):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Copy under a temporary name, so nothing can read a partly written ROM
+        descriptor, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(descriptor)
+        try:
+            shutil.copyfile(source, temp_path)
+            os.replace(temp_path, self.get_path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.directory.glob('*.gba'):
+            stat = path.stat()
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        entries.sort()
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import functools
-from typing import Callable, Mapping, NamedTuple, Sequence, Tuple, Union, TYPE_CHECKING
+from typing import Callable, Counter, Iterator, Mapping, NamedTuple, Sequence, Tuple, Union, TYPE_CHECKING
 
 from BaseClasses import CollectionState
 
+from .data import Passage
 from .items import ItemType, filter_item_names
 from .options import Logic
 
@@ -16,6 +17,7 @@ __all__ = ['Requirement', 'has', 'has_all', 'has_any', 'has_treasures', 'option'
 
 
 RequiredItem = Union[str, Tuple[str, int]]
+CompiledRule = Callable[[CollectionState], bool]
 
 
 helpers: Mapping[str, Tuple[str, int]] = {
@@ -25,6 +27,85 @@ helpers: Mapping[str, Tuple[str, int]] = {
     'Heavy Grab':         ('Progressive Grab', 2),
 }
 
+golden_treasures = tuple(filter_item_names(type=ItemType.TREASURE))
+
+
+# Wario's abilities only come in a few combinations (3 * 3 * 2 * 2 * 2 * 2),
+# so rules that only look at abilities are turned into a lookup table of that
+# size. Each ability is a digit of the state's index: (item, highest count, weight)
+def _get_ability_digits() -> Tuple[Tuple[str, int, int], ...]:
+    digits = []
+    weight = 1
+    for item in filter_item_names(type=ItemType.ABILITY):
+        limit = 2 if item.startswith('Progressive') else 1
+        digits.append((item, limit, weight))
+        weight *= limit + 1
+    return tuple(digits)
+
+
+ability_digits = _get_ability_digits()
+ability_items = frozenset(item for item, _, _ in ability_digits)
+ABILITY_STATE_COUNT = functools.reduce(lambda product, digit: product * (digit[1] + 1), ability_digits, 1)
+
+
+def ability_state_index(prog_items: Mapping[str, int]) -> int:
+    index = 0
+    for item, limit, weight in ability_digits:
+        count = prog_items[item]
+        index += weight * (count if count < limit else limit)
+    return index
+
+
+def ability_states() -> Iterator[dict[str, int]]:
+    """Item counts for every ability state, in index order."""
+    for index in range(ABILITY_STATE_COUNT):
+        yield {item: index // weight % (limit + 1) for item, limit, weight in ability_digits}
+
+
+# Values derived from the player's items. WL4World.collect and remove keep
+# these in the state's item counts under names that no real item uses.
+ABILITY_STATE = 'WL4 Ability State'
+GOLDEN_TREASURE_COUNT = 'WL4 Golden Treasure Count'
+
+# The number of complete jewels for each passage, i.e. the count of its rarest piece
+jewel_counts: Mapping[str, Tuple[str, ...]] = {
+    f'WL4 {passage.short_name()} Jewel Count': tuple(filter_item_names(type=ItemType.JEWEL, passage=passage))
+    for passage in Passage
+}
+
+
+def _set_derived_item(prog_items: Counter[str], key: str, value: int):
+    # Like World.remove, don't leave zero counts behind
+    if value:
+        prog_items[key] = value
+    else:
+        prog_items.pop(key, None)
+
+def _update_ability_state(prog_items: Counter[str]):
+    _set_derived_item(prog_items, ABILITY_STATE, ability_state_index(prog_items))
+
+def _update_golden_treasure_count(prog_items: Counter[str]):
+    _set_derived_item(prog_items, GOLDEN_TREASURE_COUNT, sum(1 for item in golden_treasures if prog_items[item]))
+
+def _jewel_count_updater(key: str, pieces: Tuple[str, ...]):
+    def update(prog_items: Counter[str]):
+        _set_derived_item(prog_items, key, min(prog_items[piece] for piece in pieces))
+    return update
+
+
+_derived_item_updates: Mapping[str, Callable[[Counter[str]], None]] = {
+    **{item: _update_ability_state for item in ability_items},
+    **{item: _update_golden_treasure_count for item in golden_treasures},
+    **{piece: _jewel_count_updater(key, pieces) for key, pieces in jewel_counts.items() for piece in pieces},
+}
+
+
+def update_derived_items(prog_items: Counter[str], item_name: str):
+    """Refresh the derived values that depend on an item after its count changed."""
+    update = _derived_item_updates.get(item_name)
+    if update is not None:
+        update(prog_items)
+
 
 def resolve_helper(item_name: RequiredItem):
     if isinstance(item_name, str):
@@ -32,43 +113,299 @@ def resolve_helper(item_name: RequiredItem):
     return item_name
 
 
+# Requirements are built as trees of these nodes, then compiled into a single
+# predicate once the world's options are known.
+
+class Has(NamedTuple):
+    item: str
+    count: int
+
+
+class HasTreasures(NamedTuple):
+    pass
+
+
+class Option(NamedTuple):
+    name: str
+    choice: int
+
+
+class Constant(NamedTuple):
+    value: bool
+
+
+class Not(NamedTuple):
+    operand: Node
+
+
+class And(NamedTuple):
+    operands: Tuple[Node, ...]
+
+
+class Or(NamedTuple):
+    operands: Tuple[Node, ...]
+
+
+Node = Union[Has, HasTreasures, Option, Constant, Not, And, Or]
+
+
+def _flatten(node_type: type[And] | type[Or], operands: Sequence[Node]) -> Node:
+    flattened = []
+    for operand in operands:
+        if isinstance(operand, node_type):
+            flattened.extend(operand.operands)
+        else:
+            flattened.append(operand)
+    if len(flattened) == 1:
+        return flattened[0]
+    return node_type(tuple(flattened))
+
+
 class Requirement(NamedTuple):
-    inner: Callable[[WL4World, CollectionState], bool]
+    node: Node
 
     def __or__(self, rhs: Requirement):
-        return Requirement(lambda w, s: self.inner(w, s) or rhs.inner(w, s))
+        return Requirement(_flatten(Or, (self.node, rhs.node)))
 
     def __and__(self, rhs: Requirement):
-        return Requirement(lambda w, s: self.inner(w, s) and rhs.inner(w, s))
+        return Requirement(_flatten(And, (self.node, rhs.node)))
+
+    def fold_options(self, world: WL4World) -> Requirement:
+        return Requirement(fold_options(self.node, world))
+
+    def is_always(self, value: bool) -> bool:
+        """Whether this requirement is known to be this value, usually after folding options."""
+        return isinstance(self.node, Constant) and self.node.value == value
 
-    def apply_world(self, world: WL4World):
-        return functools.partial(self.inner, world)
+    def apply_world(self, world: WL4World) -> CompiledRule:
+        return compile_rule(self.node, world)
 
 
 def has(item_name: RequiredItem) -> Requirement:
-    item, count = resolve_helper(item_name)
-    return Requirement(lambda w, s: s.has(item, w.player, count))
+    return Requirement(Has(*resolve_helper(item_name)))
 
 def has_all(items: Sequence[RequiredItem]) -> Requirement:
-    return Requirement(lambda w, s: all(has(item).inner(w, s) for item in items))
+    return Requirement(_flatten(And, [Has(*resolve_helper(item)) for item in items]))
 
 def has_any(items: Sequence[RequiredItem]) -> Requirement:
-    return Requirement(lambda w, s: any(has(item).inner(w, s) for item in items))
+    return Requirement(_flatten(Or, [Has(*resolve_helper(item)) for item in items]))
 
 def has_treasures() -> Requirement:
-    return Requirement(lambda w, s: sum(has(item).inner(w, s)
-                                        for item in filter_item_names(type=ItemType.TREASURE))
-                                    >= w.options.golden_treasure_count)
+    return Requirement(HasTreasures())
 
 
 def option(option_name: str, choice: int):
-    return Requirement(lambda w, _: getattr(w.options, option_name) == choice)
+    return Requirement(Option(option_name, choice))
 
 def difficulty(difficulty: int):
     return option('difficulty', difficulty)
 
 def not_difficulty(_difficulty: int):
-    return Requirement(lambda w, s: not difficulty(_difficulty).inner(w, s))
+    return Requirement(Not(difficulty(_difficulty).node))
 
 def advanced_logic():
     return option('logic', Logic.option_advanced)
+
+
+def _merge_counts(leaves: Sequence[Has], combine: Callable[[int, int], int]) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    for item, count in leaves:
+        counts[item] = combine(counts[item], count) if item in counts else count
+    return counts
+
+
+def _use_jewel_counts(counts: dict[str, int]) -> Tuple[Tuple[str, int], ...]:
+    """Check every piece of a jewel at once through the passage's jewel count."""
+    for key, pieces in jewel_counts.items():
+        if not all(piece in counts for piece in pieces):
+            continue
+        jewels = min(counts[piece] for piece in pieces)
+        for piece in pieces:
+            if counts[piece] == jewels:
+                del counts[piece]
+        counts[key] = jewels
+    return tuple(counts.items())
+
+
+def _compile_has_all(player: int, counts: Tuple[Tuple[str, int], ...]) -> CompiledRule:
+    if len(counts) == 1:
+        ((item, count),) = counts
+        return lambda state: state.prog_items[player][item] >= count
+
+    def rule(state: CollectionState):
+        prog_items = state.prog_items[player]
+        for item, count in counts:
+            if prog_items[item] < count:
+                return False
+        return True
+    return rule
+
+
+def _compile_has_any(player: int, counts: Tuple[Tuple[str, int], ...]) -> CompiledRule:
+    if len(counts) == 1:
+        return _compile_has_all(player, counts)
+
+    def rule(state: CollectionState):
+        prog_items = state.prog_items[player]
+        for item, count in counts:
+            if prog_items[item] >= count:
+                return True
+        return False
+    return rule
+
+
+def _compile_all(predicates: Sequence[CompiledRule]) -> CompiledRule:
+    if len(predicates) == 1:
+        return predicates[0]
+    if len(predicates) == 2:
+        first, second = predicates
+        return lambda state: first(state) and second(state)
+    predicates = tuple(predicates)
+
+    def rule(state: CollectionState):
+        for predicate in predicates:
+            if not predicate(state):
+                return False
+        return True
+    return rule
+
+
+def _compile_any(predicates: Sequence[CompiledRule]) -> CompiledRule:
+    if len(predicates) == 1:
+        return predicates[0]
+    if len(predicates) == 2:
+        first, second = predicates
+        return lambda state: first(state) or second(state)
+    predicates = tuple(predicates)
+
+    def rule(state: CollectionState):
+        for predicate in predicates:
+            if predicate(state):
+                return True
+        return False
+    return rule
+
+
+def fold_options(node: Node, world: WL4World) -> Node:
+    """Replace option checks with their result for this world, then drop the
+    branches that can't matter anymore."""
+    if isinstance(node, Option):
+        return Constant(bool(getattr(world.options, node.name) == node.choice))
+    if isinstance(node, Not):
+        operand = fold_options(node.operand, world)
+        if isinstance(operand, Constant):
+            return Constant(not operand.value)
+        return Not(operand)
+    if isinstance(node, (And, Or)):
+        # True decides an Or, and False decides an And
+        deciding_value = isinstance(node, Or)
+        operands = []
+        for operand in node.operands:
+            operand = fold_options(operand, world)
+            if isinstance(operand, Constant):
+                if operand.value == deciding_value:
+                    return operand
+                continue
+            operands.append(operand)
+        if not operands:
+            return Constant(not deciding_value)
+        return _flatten(type(node), operands)
+    return node
+
+
+def uses_only_abilities(node: Node) -> bool:
+    if isinstance(node, Has):
+        return node.item in ability_items
+    if isinstance(node, Not):
+        return uses_only_abilities(node.operand)
+    if isinstance(node, (And, Or)):
+        return all(map(uses_only_abilities, node.operands))
+    return False
+
+
+def evaluate(node: Node, world: WL4World, items: Mapping[str, int]) -> bool:
+    """Check a requirement against item counts directly, without compiling it."""
+    if isinstance(node, Has):
+        return items.get(node.item, 0) >= node.count
+    if isinstance(node, HasTreasures):
+        return sum(items.get(item, 0) > 0 for item in golden_treasures) >= world.options.golden_treasure_count
+    if isinstance(node, Option):
+        return getattr(world.options, node.name) == node.choice
+    if isinstance(node, Constant):
+        return node.value
+    if isinstance(node, Not):
+        return not evaluate(node.operand, world, items)
+    if isinstance(node, And):
+        return all(evaluate(operand, world, items) for operand in node.operands)
+    if isinstance(node, Or):
+        return any(evaluate(operand, world, items) for operand in node.operands)
+    raise TypeError(f'Unknown requirement node: {node!r}')
+
+
+_truth_tables: dict[str, Tuple[bool, ...]] = {}
+
+def get_truth_table(node: Node, world: WL4World) -> Tuple[bool, ...]:
+    """Evaluate an ability-only requirement in every ability state. The node
+    must have its options folded already, so tables can be shared between worlds."""
+    # Nodes compare like plain tuples, so And((a, b)) == Or((a, b)). The repr has the node types.
+    key = repr(node)
+    table = _truth_tables.get(key)
+    if table is None:
+        table = _truth_tables[key] = tuple(evaluate(node, world, items) for items in ability_states())
+    return table
+
+
+def _compile_truth_table(node: Node, world: WL4World) -> CompiledRule:
+    table = get_truth_table(node, world)
+    if all(table):
+        return lambda _: True
+    if not any(table):
+        return lambda _: False
+    player = world.player
+    return lambda state: table[state.prog_items[player][ABILITY_STATE]]
+
+
+def compile_rule(node: Node, world: WL4World) -> CompiledRule:
+    """Turn a requirement tree into one predicate over a CollectionState.
+    Options are folded in first, and helper names are already resolved. Item
+    checks that are siblings in an and/or chain share one lookup of the
+    player's items. Any part of the tree that only depends on abilities
+    becomes a truth table lookup, leaving only the other items to be checked
+    on their own."""
+    return _compile(fold_options(node, world), world)
+
+
+def _compile(node: Node, world: WL4World) -> CompiledRule:
+    player = world.player
+
+    if isinstance(node, Constant):
+        value = node.value
+        return lambda _: value
+    if uses_only_abilities(node) and not isinstance(node, Has):
+        return _compile_truth_table(node, world)
+    if isinstance(node, Has):
+        return _compile_has_all(player, (tuple(node),))
+    if isinstance(node, HasTreasures):
+        return _compile_has_all(player, ((GOLDEN_TREASURE_COUNT, world.options.golden_treasure_count.value),))
+    if isinstance(node, Not):
+        operand = _compile(node.operand, world)
+        return lambda state: not operand(state)
+
+    operands = node.operands
+    predicates = []
+    ability_operands = tuple(filter(uses_only_abilities, operands))
+    if len(ability_operands) > 1:
+        predicates.append(_compile_truth_table(type(node)(ability_operands), world))
+        operands = tuple(operand for operand in operands if not uses_only_abilities(operand))
+
+    leaves = [operand for operand in operands if isinstance(operand, Has)]
+    predicates.extend(_compile(operand, world) for operand in operands if not isinstance(operand, Has))
+    if isinstance(node, And):
+        if leaves:
+            predicates.insert(0, _compile_has_all(player, _use_jewel_counts(_merge_counts(leaves, max))))
+        return _compile_all(predicates)
+    if isinstance(node, Or):
+        if leaves:
+            predicates.insert(0, _compile_has_any(player, tuple(_merge_counts(leaves, min).items())))
+        return _compile_any(predicates)
+    raise TypeError(f'Unknown requirement node: {node!r}')
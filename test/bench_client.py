@@ -0,0 +1,172 @@
+"""
+Headless throughput benchmark for the client loop, run against the fake
+emulator in fake_bizhawk.py. Run it from the Archipelago directory:
+
+    python -m worlds.wl4.test.bench_client
+
+For each scripted scenario this reports game watcher ticks per second,
+connector round trips per tick, and how long it took for a box opened in
+memory to show up in a LocationChecks message.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Iterable, NamedTuple
+
+from ..client import GAMEMODE_SELECT, SELECT_PASSAGE, WL4Client
+from ..data import Passage
+from ..locations import level_location_bits
+from .fake_bizhawk import FakeClientContext, FakeGBA, create_fake_client
+
+
+class ScenarioResult(NamedTuple):
+    name: str
+    ticks: int
+    seconds: float
+    round_trips: int
+    location_latencies: list[tuple[int, float]]  # (ticks, seconds) per location
+
+    def as_dict(self):
+        latency_ticks = [ticks for ticks, _ in self.location_latencies]
+        latency_seconds = [seconds for _, seconds in self.location_latencies]
+        return {
+            'ticks': self.ticks,
+            'ticks_per_second': self.ticks / self.seconds if self.seconds else 0.0,
+            'round_trips_per_tick': self.round_trips / self.ticks if self.ticks else 0.0,
+            'locations_sent': len(self.location_latencies),
+            'mean_latency_ticks': sum(latency_ticks) / len(latency_ticks) if latency_ticks else None,
+            'mean_latency_ms': 1000 * sum(latency_seconds) / len(latency_seconds) if latency_seconds else None,
+        }
+
+
+class ClientBench:
+    """Drives the client one tick at a time and times it."""
+
+    client: WL4Client
+    client_ctx: FakeClientContext
+    gba: FakeGBA
+
+    def __init__(self, client: WL4Client, client_ctx: FakeClientContext, gba: FakeGBA):
+        self.client = client
+        self.client_ctx = client_ctx
+        self.gba = gba
+        self.ticks = 0
+        self.seconds = 0.0
+        self.pending_locations: dict[int, tuple[int, float]] = {}
+        self.location_latencies = []
+        self.messages_seen = 0
+
+    async def tick(self, count: int = 1):
+        for _ in range(count):
+            start = time.perf_counter()
+            await self.client.game_watcher(self.client_ctx)
+            self.seconds += time.perf_counter() - start
+            self.ticks += 1
+            self._match_sent_locations()
+
+    def expect_locations(self, location_ids: Iterable[int]):
+        """Start the latency clock for locations that were just set in memory."""
+        now = time.perf_counter()
+        for location_id in location_ids:
+            self.pending_locations.setdefault(location_id, (self.ticks, now))
+
+    def _match_sent_locations(self):
+        sent_messages = self.client_ctx.sent_messages
+        for sent in sent_messages[self.messages_seen:]:
+            if sent.msg['cmd'] != 'LocationChecks':
+                continue
+            for location_id in sent.msg['locations']:
+                start = self.pending_locations.pop(location_id, None)
+                if start is not None:
+                    start_tick, start_time = start
+                    self.location_latencies.append((self.ticks - start_tick, sent.time - start_time))
+        self.messages_seen = len(sent_messages)
+
+
+async def title_screen(bench: ClientBench):
+    await bench.tick(1000)
+
+
+async def play_levels(bench: ClientBench):
+    bench.gba.set_send_immediately(True)
+    for passage in range(Passage.EMERALD, Passage.SAPPHIRE + 1):
+        for level in range(4):
+            bench.gba.enter_level(passage, level)
+            await bench.tick(5)
+            for bit, location_id in level_location_bits[(passage, level)]:
+                if location_id not in bench.client_ctx.server_locations:
+                    continue
+                bench.gba.open_box(bit)
+                bench.expect_locations([location_id])
+                await bench.tick(5)
+            bench.gba.eject()
+            await bench.tick(5)
+            bench.gba.go_to_passage_select()
+            await bench.tick(5)
+
+
+async def die_repeatedly(bench: ClientBench):
+    bench.client.death_link.enabled = True
+    for _ in range(50):
+        bench.gba.enter_level(Passage.RUBY, 1)
+        await bench.tick(5)
+        bench.gba.die()
+        await bench.tick(5)
+        bench.gba.go_to_passage_select()
+        await bench.tick(5)
+
+
+async def receive_item_backlog(bench: ClientBench):
+    bench.gba.set_game_mode(GAMEMODE_SELECT, SELECT_PASSAGE)
+    bench.client_ctx.receive_items(['Heart', 'Minigame Medal', 'Full Health Item'] * 100)
+    await bench.tick()
+    while bench.client.item_backlog and bench.ticks < 10000:
+        await bench.tick()
+
+
+scenarios: dict[str, Callable[[ClientBench], Awaitable[None]]] = {
+    'title screen': title_screen,
+    'play levels': play_levels,
+    'death link': die_repeatedly,
+    'item backlog': receive_item_backlog,
+}
+
+
+async def run_scenario(name: str, scenario: Callable[[ClientBench], Awaitable[None]]) -> ScenarioResult:
+    bench = ClientBench(*await create_fake_client())
+    await scenario(bench)
+    return ScenarioResult(name, bench.ticks, bench.seconds, bench.client_ctx.bizhawk_ctx.round_trips,
+                          bench.location_latencies)
+
+
+async def run_all() -> list[ScenarioResult]:
+    return [await run_scenario(name, scenario) for name, scenario in scenarios.items()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Wario Land 4 client against a fake emulator.')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    results = asyncio.run(run_all())
+    print(f'{"Scenario":<16}{"Ticks":>8}{"Ticks/s":>12}{"Trips/tick":>12}{"Latency (ticks)":>17}{"Latency (ms)":>14}')
+    for result in results:
+        stats = result.as_dict()
+        latency_ticks = stats['mean_latency_ticks']
+        latency_ms = stats['mean_latency_ms']
+        print(f'{result.name:<16}{stats["ticks"]:>8}{stats["ticks_per_second"]:>12.0f}'
+              f'{stats["round_trips_per_tick"]:>12.2f}'
+              f'{"-" if latency_ticks is None else f"{latency_ticks:.2f}":>17}'
+              f'{"-" if latency_ms is None else f"{latency_ms:.3f}":>14}')
+
+    if args.json:
+        with open(args.json, 'w') as stream:
+            json.dump({result.name: result.as_dict() for result in results}, stream, indent=2)
+
+
+if __name__ == '__main__':
+    main()
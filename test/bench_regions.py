@@ -0,0 +1,45 @@
+"""
+Times region creation for a multiworld of identical Wario Land 4 slots. Run
+it from the Archipelago directory:
+
+    python -m worlds.wl4.test.bench_regions [--slots 50]
+
+Slots with the same level options share one level layout, so this reports
+the time with the layout cache in use and with it cleared before each slot.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from test.general import setup_multiworld
+from worlds.AutoWorld import call_single
+
+from .. import WL4World
+from .. import regions
+
+
+def time_create_regions(slots: int, share_layouts: bool) -> float:
+    multiworld = setup_multiworld([WL4World] * slots, ('generate_early',))
+    regions._level_layouts.clear()
+    start = time.perf_counter()
+    for player in multiworld.player_ids:
+        if not share_layouts:
+            regions._level_layouts.clear()
+        call_single(multiworld, 'create_regions', player)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark region creation for identical Wario Land 4 slots.')
+    parser.add_argument('--slots', type=int, default=50)
+    args = parser.parse_args()
+
+    for name, share_layouts in (('cleared', False), ('shared', True)):
+        seconds = time_create_regions(args.slots, share_layouts)
+        print(f'{name:<8}{args.slots:>4} slots {1000 * seconds:>10.1f} ms {1000 * seconds / args.slots:>8.2f} ms/slot')
+
+
+if __name__ == '__main__':
+    main()
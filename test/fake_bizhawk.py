@@ -0,0 +1,273 @@
+"""
+A stand-in for the BizHawk connector that lets the client run without an
+emulator. FakeGBA models the GBA system bus along with the small part of the
+game's behavior the client relies on, FakeBizHawkContext answers connector
+requests against it, and FakeClientContext records what the client sends to
+the server.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import time
+from types import SimpleNamespace
+from typing import Any, Iterable, NamedTuple, Optional
+
+from NetUtils import NetworkItem
+
+from ..client import (GAMEMODE_INGAME, GAMEMODE_SELECT, GAMEMODE_TITLE_CUTSCENE, INGAME_WARIOCONTROL,
+                      MULTIWORLD_IDLE, MULTIWORLD_ITEM_QUEUED, SELECT_EJECTION_STATES, SELECT_PASSAGE,
+                      WL4Client, collected_items_address, incoming_item_address, inventory_address,
+                      item_sender_address, level_address, main_game_mode_address, multiworld_send_address,
+                      multiworld_state_address, passage_address, received_item_count_address, room_address,
+                      sub_game_mode_address, wario_health_address)
+from ..data import get_symbol
+from ..items import ap_id_from_wl4_data, item_table
+from ..locations import location_name_to_id, location_table
+
+
+SYSTEM_BUS = 'System Bus'
+
+
+class MemoryRegion(NamedTuple):
+    start: int
+    data: bytearray
+
+
+class FakeGBA:
+    """GBA system bus memory. Every connector request takes one frame."""
+
+    regions: list[MemoryRegion]
+    frame: int
+    item_delivery_frames: int
+    item_queued_frame: Optional[int]
+    delivered_items: list[tuple[int, bytes]]
+
+    def __init__(self, item_delivery_frames: int = 2):
+        self.regions = [
+            MemoryRegion(0x2000000, bytearray(0x40000)),  # EWRAM
+            MemoryRegion(0x3000000, bytearray(0x8000)),  # IWRAM
+            MemoryRegion(0x8000000, bytearray(0x800000)),  # ROM
+        ]
+        self.frame = 0
+        self.item_delivery_frames = item_delivery_frames
+        self.item_queued_frame = None
+        self.delivered_items = []
+
+        self.write(0x80000A0, b'WARIOLANDAPE')
+        self.write(get_symbol('PlayerName'), b'Player')
+        self.write(get_symbol('SeedName'), b'FakeSeed')
+        self.set_game_mode(GAMEMODE_TITLE_CUTSCENE, 0)
+        self.write_int(wario_health_address, 8, 1)
+
+    def _locate(self, address: int, size: int) -> tuple[bytearray, int]:
+        for start, data in self.regions:
+            if start <= address and address + size <= start + len(data):
+                return data, address - start
+        raise IndexError(f'Address out of range: 0x{address:07x}+{size}')
+
+    def read(self, address: int, size: int) -> bytes:
+        data, offset = self._locate(address, size)
+        return bytes(data[offset:offset + size])
+
+    def write(self, address: int, value: bytes):
+        data, offset = self._locate(address, len(value))
+        data[offset:offset + len(value)] = value
+
+    def read_int(self, address: int, size: int) -> int:
+        return int.from_bytes(self.read(address, size), 'little')
+
+    def write_int(self, address: int, value: int, size: int):
+        self.write(address, value.to_bytes(size, 'little'))
+
+    def step(self):
+        """Advance one frame, delivering a queued multiworld item once it's
+        been waiting long enough."""
+        self.frame += 1
+        if self.read_int(multiworld_state_address, 1) != MULTIWORLD_ITEM_QUEUED:
+            self.item_queued_frame = None
+            return
+        if self.item_queued_frame is None:
+            self.item_queued_frame = self.frame
+        if self.frame - self.item_queued_frame < self.item_delivery_frames:
+            return
+
+        sender = self.read(item_sender_address, 64)
+        self.delivered_items.append((self.read_int(incoming_item_address, 1), sender[:sender.index(0xFE)]))
+        count = self.read_int(received_item_count_address, 2)
+        self.write_int(received_item_count_address, count + 1, 2)
+        self.write_int(multiworld_state_address, MULTIWORLD_IDLE, 1)
+        self.item_queued_frame = None
+
+    # Scripted game events
+
+    def set_game_mode(self, main: int, sub: int):
+        self.write_int(main_game_mode_address, main, 2)
+        self.write_int(sub_game_mode_address, sub, 2)
+
+    def set_send_immediately(self, value: bool):
+        self.write_int(multiworld_send_address, int(value), 1)
+
+    def status_address(self, passage: int, level: int) -> int:
+        return inventory_address + 4 * (6 * passage + level)
+
+    def enter_level(self, passage: int, level: int, room: int = 0):
+        self.write_int(passage_address, passage, 1)
+        self.write_int(level_address, level, 1)
+        self.write_int(room_address, room, 1)
+        self.write_int(collected_items_address, 0, 4)
+        self.set_game_mode(GAMEMODE_INGAME, INGAME_WARIOCONTROL)
+
+    def open_box(self, flag: int):
+        collected = self.read_int(collected_items_address, 4)
+        self.write_int(collected_items_address, collected | flag, 4)
+
+    def die(self):
+        self.write_int(wario_health_address, 0, 1)
+
+    def eject(self):
+        """Leave the level through the portal and save what was collected."""
+        passage = self.read_int(passage_address, 1)
+        level = self.read_int(level_address, 1)
+        status_address = self.status_address(passage, level)
+        collected = self.read_int(collected_items_address, 4)
+        status = self.read_int(status_address, 4)
+        self.write_int(status_address, status | collected << 8, 4)
+        self.set_game_mode(GAMEMODE_SELECT, SELECT_EJECTION_STATES[0])
+
+    def go_to_passage_select(self):
+        self.write_int(wario_health_address, 8, 1)
+        self.set_game_mode(GAMEMODE_SELECT, SELECT_PASSAGE)
+
+
+class FakeBizHawkContext:
+    """Answers the connector's JSON requests the way the BizHawk script does.
+    A request list is handled within one frame, and a failed guard prevents
+    every write in the same list."""
+
+    gba: FakeGBA
+    round_trips: int
+    bytes_read: int
+    bytes_written: int
+
+    def __init__(self, gba: FakeGBA):
+        self.gba = gba
+        self.round_trips = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    async def _send_message(self, message: str) -> str:
+        self.round_trips += 1
+        requests = json.loads(message)
+        guards_passed = all(self._check_guard(request) for request in requests if request['type'] == 'GUARD')
+        responses = [self._process(request, guards_passed) for request in requests]
+        self.gba.step()
+        return json.dumps(responses)
+
+    def _check_guard(self, request: dict[str, Any]) -> bool:
+        expected = base64.b64decode(request['expected_data'])
+        return self.gba.read(request['address'], len(expected)) == expected
+
+    def _process(self, request: dict[str, Any], guards_passed: bool) -> dict[str, Any]:
+        request_type = request['type']
+        if request.get('domain', SYSTEM_BUS) != SYSTEM_BUS:
+            return {'type': 'ERROR', 'err': f'Unsupported domain: {request["domain"]}'}
+
+        if request_type == 'GUARD':
+            return {'type': 'GUARD_RESPONSE', 'value': self._check_guard(request), 'address': request['address']}
+        if request_type == 'READ':
+            self.bytes_read += request['size']
+            value = self.gba.read(request['address'], request['size'])
+            return {'type': 'READ_RESPONSE', 'value': base64.b64encode(value).decode('ascii')}
+        if request_type == 'WRITE':
+            if guards_passed:
+                value = base64.b64decode(request['value'])
+                self.bytes_written += len(value)
+                self.gba.write(request['address'], value)
+            return {'type': 'WRITE_RESPONSE'}
+        return {'type': 'ERROR', 'err': f'Unsupported request type: {request_type}'}
+
+
+class SentMessage(NamedTuple):
+    time: float
+    msg: dict[str, Any]
+
+
+class FakeCommandProcessor:
+    def __init__(self):
+        self.commands = {}
+
+
+class FakeClientContext:
+    """The parts of BizHawkClientContext that WL4Client uses."""
+
+    def __init__(self, bizhawk_ctx: FakeBizHawkContext, server_locations: Iterable[int], slot_data: dict[str, Any]):
+        self.bizhawk_ctx = bizhawk_ctx
+        self.command_processor = FakeCommandProcessor()
+        self.game = None
+        self.items_handling = None
+        self.want_slot_data = False
+        self.seed_name = None
+        self.server_locations = set(server_locations)
+        self.checked_locations = set()
+        self.slot_data = slot_data
+        self.slot = 1
+        self.team = 0
+        self.auth = 'Player'
+        self.player_names = {0: 'Archipelago', 1: 'Player', 2: 'Other Player'}
+        self.items_received = []
+        self.finished_game = False
+        self.death_link_enabled = False
+        self.last_death_link = 0.0
+        # Only checked to see whether there's a connection
+        self.server = SimpleNamespace(socket=object())
+        self.watcher_timeout = 0.5
+        self.sent_messages = []
+
+    async def send_msgs(self, msgs: list[dict[str, Any]]):
+        now = time.perf_counter()
+        for msg in msgs:
+            self.sent_messages.append(SentMessage(now, msg))
+            if msg['cmd'] == 'LocationChecks':
+                self.checked_locations.update(msg['locations'])
+            if msg['cmd'] == 'StatusUpdate':
+                self.finished_game = True
+
+    async def update_death_link(self, death_link: bool):
+        self.death_link_enabled = death_link
+
+    async def disconnect(self):
+        pass
+
+    def receive_items(self, item_names: Iterable[str], sender: int = 2):
+        for name in item_names:
+            self.items_received.append(NetworkItem(ap_id_from_wl4_data(item_table[name]), 0, sender, 0))
+
+    def messages(self, cmd: str) -> list[dict[str, Any]]:
+        return [sent.msg for sent in self.sent_messages if sent.msg['cmd'] == cmd]
+
+
+def location_ids_for_difficulty(difficulty: int) -> set[int]:
+    return {location_name_to_id[name] for name, data in location_table.items() if difficulty in data.difficulties}
+
+
+def connect_client(client: WL4Client, client_ctx: FakeClientContext):
+    """Pretend the server just accepted the connection."""
+    client.on_package(client_ctx, 'Connected', {'slot_data': client_ctx.slot_data})
+
+
+async def create_fake_client(difficulty: int = 0, slot_data: Optional[dict[str, Any]] = None,
+                             item_delivery_frames: int = 2) -> tuple[WL4Client, FakeClientContext, FakeGBA]:
+    """Set up a client that has validated the fake ROM and connected to a
+    server, with every location of the given difficulty in the seed."""
+    gba = FakeGBA(item_delivery_frames)
+    client_ctx = FakeClientContext(FakeBizHawkContext(gba),
+                                   location_ids_for_difficulty(difficulty),
+                                   {'difficulty': difficulty, **(slot_data or {})})
+    client = WL4Client()
+    assert await client.validate_rom(client_ctx)
+    await client.set_auth(client_ctx)
+    connect_client(client, client_ctx)
+    client_ctx.bizhawk_ctx.round_trips = 0
+    return client, client_ctx, gba
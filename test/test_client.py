@@ -0,0 +1,122 @@
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from ..client import GAMEMODE_SELECT, SELECT_PASSAGE, TRACKER_EVENT_FLAGS
+from ..client_stats import ClientStats
+from ..data import ItemFlag, Passage
+from ..locations import location_name_to_id
+from .fake_bizhawk import create_fake_client
+
+
+class TestClientLoop(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client, self.client_ctx, self.gba = await create_fake_client()
+
+    async def tick(self):
+        await self.client.game_watcher(self.client_ctx)
+
+    async def test_idle_tick_is_one_round_trip(self):
+        """The title screen only needs the snapshot read"""
+        await self.tick()
+        self.assertEqual(self.client_ctx.bizhawk_ctx.round_trips, 1)
+
+    async def test_location_sent_once(self):
+        """Opening a box reports it immediately, and only once"""
+        self.gba.set_send_immediately(True)
+        self.gba.enter_level(Passage.EMERALD, 0)
+        await self.tick()
+        self.assertEqual(self.client_ctx.messages('LocationChecks'), [])
+
+        self.gba.open_box(ItemFlag.CD)
+        await self.tick()
+        self.gba.eject()
+        await self.tick()
+        self.assertEqual(
+            [set(msg['locations']) for msg in self.client_ctx.messages('LocationChecks')],
+            [{location_name_to_id['Palm Tree Paradise - CD Box']}]
+        )
+
+    async def test_locations_sent_on_escape(self):
+        """Without sending immediately, boxes are reported once saved"""
+        self.gba.enter_level(Passage.RUBY, 2)
+        self.gba.open_box(ItemFlag.JEWEL_NE | ItemFlag.CD)
+        await self.tick()
+        self.assertEqual(self.client_ctx.checked_locations, set())
+
+        self.gba.eject()
+        await self.tick()
+        self.assertEqual(self.client_ctx.checked_locations, {
+            location_name_to_id['40 Below Fridge - Looping Room Box'],
+            location_name_to_id['40 Below Fridge - CD Box'],
+        })
+
+    async def test_item_backlog(self):
+        """A backlog of received items is delivered without waiting for more ticks"""
+        self.gba.set_game_mode(GAMEMODE_SELECT, SELECT_PASSAGE)
+        self.client_ctx.receive_items(['Heart'] * 20)
+        await self.tick()
+        # The last item is still being handed over when the tick ends
+        self.assertEqual(len(self.gba.delivered_items), 19)
+
+        for _ in range(3):
+            await self.tick()
+        self.assertEqual(len(self.gba.delivered_items), 20)
+        self.assertEqual(self.client.item_backlog, 0)
+
+    async def test_long_item_backlog_spans_ticks(self):
+        """A long backlog is handed over a bit at a time so other handlers keep running"""
+        self.gba.set_game_mode(GAMEMODE_SELECT, SELECT_PASSAGE)
+        self.client_ctx.receive_items(['Heart'] * 100)
+        await self.tick()
+        self.assertLess(len(self.gba.delivered_items), 99)
+
+        for _ in range(10):
+            await self.tick()
+        self.assertEqual(len(self.gba.delivered_items), 100)
+        self.assertEqual(self.client.item_backlog, 0)
+
+    async def test_death_sent_once(self):
+        """Dying sends one death link message, counted in the client stats"""
+        self.client, self.client_ctx, self.gba = await create_fake_client(slot_data={'death_link': True})
+        self.gba.go_to_passage_select()
+        self.gba.enter_level(Passage.EMERALD, 0)
+        await self.tick()
+        self.assertEqual(self.client_ctx.messages('Bounce'), [])
+        self.gba.die()
+        await self.tick()
+        await self.tick()
+        self.assertEqual(len(self.client_ctx.messages('Bounce')), 1)
+        self.assertEqual(self.client.stats.messages_sent['Bounce'], 1)
+
+    async def test_tracker_events_set_once(self):
+        """Taking a Keyzer out of a level sets its tracker event bit once"""
+        self.gba.set_game_mode(GAMEMODE_SELECT, SELECT_PASSAGE)
+        self.gba.write_int(self.gba.status_address(Passage.EMERALD, 0), ItemFlag.KEYZER, 4)
+        await self.tick()
+        await self.tick()
+        self.assertEqual(
+            [msg['operations'] for msg in self.client_ctx.messages('Set')],
+            [[{'operation': 'or', 'value': 1 << TRACKER_EVENT_FLAGS.index('Palm Tree Paradise')}]]
+        )
+
+
+class TestClientStats(TestCase):
+    def test_received_times_pruned(self):
+        """Items the game already has stop being tracked for delivery latency"""
+        stats = ClientStats()
+        stats.record_items_received(0, 5)
+        stats.record_received_count(3)
+        self.assertEqual(set(stats.item_received_times), {3, 4})
+
+        # Reconnecting resends everything from the start
+        stats.record_items_received(0, 6)
+        self.assertEqual(set(stats.item_received_times), {3, 4, 5})
+
+    def test_unwritable_dump_stops_dumping(self):
+        """A dump file that can't be written turns dumping off instead of raising"""
+        stats = ClientStats()
+        with tempfile.TemporaryDirectory() as directory:
+            stats.start_dumping(os.path.join(directory, 'missing', 'stats.json'), 0)
+            stats.dump_if_due()
+        self.assertIsNone(stats.dump_path)
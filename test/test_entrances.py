@@ -1,3 +1,5 @@
+from BaseClasses import CollectionState
+
 from .. import options
 from . import WL4TestBase
 
@@ -23,6 +25,22 @@ class TestEntrances(WL4TestBase):
         ])
 
 
+class TestRegionGraph(WL4TestBase):
+    def test_matches_generic_update(self):
+        """Test that the region graph reaches the same regions by the same paths as the generic update"""
+        region_graph = self.multiworld.worlds[self.player].region_graph
+        state = CollectionState(self.multiworld)
+        items = [item for item in self.multiworld.itempool if item.player == self.player and item.advancement]
+        for item in items:
+            state.collect(item, True)
+            generic = state.copy()
+            region_graph.update_reachable_regions(state)
+            generic.update_reachable_regions(self.player)
+            self.assertEqual(state.reachable_regions[self.player], generic.reachable_regions[self.player])
+            self.assertEqual(state.blocked_connections[self.player], generic.blocked_connections[self.player])
+            self.assertEqual(state.path, generic.path)
+
+
 class TestEntrancesBasic(TestEntrances):
     options = {'open_doors': options.OpenDoors.option_off, 'required_jewels': 0}
 
@@ -3,9 +3,10 @@ from test.bases import TestBase
 
 from ..data import Passage
 from ..items import ItemType, ap_id_from_wl4_data, filter_items, filter_item_names, item_table, wl4_data_from_ap_id
-from ..locations import get_level_locations, location_table
-from ..options import Difficulty
+from ..locations import get_level_locations, level_location_bits, location_name_to_id, location_table
+from ..options import Difficulty, Logic
 from ..region_data import level_table
+from ..rules import And, Has, Option, Or, advanced_logic, has, has_all, has_any
 
 
 main_levels = ['Palm Tree Paradise', 'Wildflower Fields', 'Mystic Lake', 'Monsoon Jungle',
@@ -47,6 +48,13 @@ class TestHelpers(TestBase):
             checks = get_level_locations(Passage.GOLDEN, 0)
             assert all(map(lambda l: l.startswith('Golden Passage'), checks))
 
+    def test_level_location_bits(self):
+        """Test that the client's decode tables agree with the location table"""
+        for name, data in location_table.items():
+            with self.subTest(name):
+                self.assertIn(name, get_level_locations(data.passage, data.level))
+                self.assertIn((data.flag, location_name_to_id[name]), level_location_bits[data.level_id()])
+
     def test_item_id_conversion(self):
         """Test that item ID conversion works both ways"""
         for name, data in item_table.items():
@@ -54,6 +62,17 @@ class TestHelpers(TestBase):
                 ap_id = ap_id_from_wl4_data(data)
                 self.assertEqual((name, data), wl4_data_from_ap_id(ap_id))
 
+    def test_requirement_flattening(self):
+        """Test that chained requirements build flat trees with helpers resolved"""
+        requirement = has('Grab') | has('Swim') | advanced_logic() & has_all(['Stomp Jump', 'Super Ground Pound'])
+        # Nodes compare like plain tuples, so compare reprs to check the node types too
+        self.assertEqual(repr(requirement.node), repr(Or((
+            Has('Progressive Grab', 1),
+            Has('Swim', 1),
+            And((Option('logic', Logic.option_advanced), Has('Stomp Jump', 1), Has('Progressive Ground Pound', 2))),
+        ))))
+        self.assertEqual(repr(has_any(['Heavy Grab']).node), repr(Has('Progressive Grab', 2)))
+
 
 class TestLocationExistence(TestBase):
     def _test_locations_match(self, difficulty):
@@ -0,0 +1,191 @@
+import hashlib
+import itertools
+import os
+from pathlib import Path
+import random
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+from test.bases import TestBase
+from worlds.Files import APPatchExtension, APTokenMixin, APTokenTypes
+
+from ..options import MusicShuffle
+from ..rom import SHUFFLE_SEED_FILE, LocalRom, WL4PatchExtensions, WL4ProcedurePatch, get_file_md5, merge_writes
+from ..rom_cache import PatchedRomCache
+
+
+class TestMergeWrites(TestBase):
+    @staticmethod
+    def apply_writes(rom: bytes, writes) -> bytes:
+        buffer = bytearray(rom)
+        for address, data in writes:
+            buffer[address:address + len(data)] = data
+        return bytes(buffer)
+
+    def test_merged_writes_match(self):
+        """Test that merged writes leave the same bytes as writing one at a time"""
+        rng = random.Random(0)
+        rom = rng.randbytes(300)
+        for _ in range(200):
+            writes = [(rng.randrange(256), rng.randbytes(rng.randrange(1, 12)))
+                      for _ in range(rng.randrange(1, 40))]
+            blocks = merge_writes(writes)
+            self.assertEqual(self.apply_writes(rom, blocks), self.apply_writes(rom, writes))
+            for (address, data), (next_address, _) in itertools.pairwise(blocks):
+                self.assertLess(address + len(data), next_address)
+
+
+class UnmergedTokens(APTokenMixin):
+    pass
+
+
+class TestPatchTokens(TestBase):
+    @staticmethod
+    def apply_tokens(rom: bytes, token_binary: bytes) -> bytes:
+        caller = SimpleNamespace(get_file=lambda _: token_binary)
+        return bytes(APPatchExtension.apply_tokens(caller, rom, 'token_data.bin'))
+
+    def test_merged_tokens_match(self):
+        """Test that merging a patch's writes leaves the same ROM as its tokens one at a time, in order"""
+        rng = random.Random(0)
+        rom = rng.randbytes(300)
+        for _ in range(100):
+            merged, unmerged = WL4ProcedurePatch(), UnmergedTokens()
+            for _ in range(rng.randrange(1, 40)):
+                kind = rng.random()
+                if kind < 0.7:
+                    token = (APTokenTypes.WRITE, rng.randrange(256), rng.randbytes(rng.randrange(1, 12)))
+                elif kind < 0.8:
+                    token = (APTokenTypes.OR_8, rng.randrange(256), rng.getrandbits(8))
+                elif kind < 0.9:
+                    token = (APTokenTypes.XOR_8, rng.randrange(256), rng.getrandbits(8))
+                else:
+                    token = (APTokenTypes.COPY, rng.randrange(256), (rng.randrange(1, 32), rng.randrange(256)))
+                merged.write_token(*token)
+                unmerged.write_token(*token)
+            self.assertEqual(self.apply_tokens(rom, merged.get_token_binary()),
+                             self.apply_tokens(rom, unmerged.get_token_binary()))
+
+
+class TestLocalRom(TestBase):
+    def test_bulk_accessors(self):
+        """Test that table reads and writes match reading and writing one value at a time"""
+        rng = random.Random(0)
+        data = rng.randbytes(0x400)
+        rom = LocalRom(data)
+        for stride in (2, 4, 8, 12):
+            self.assertEqual(rom.read_halfwords(0x10, 20, stride),
+                             [rom.read_halfword(0x10 + stride * i) for i in range(20)])
+        for stride in (4, 8, 12):
+            self.assertEqual(rom.read_words(0x20, 20, stride), [rom.read_word(0x20 + stride * i) for i in range(20)])
+
+        for stride in (4, 8, 12):
+            values = [rng.getrandbits(32) for _ in range(20)]
+            bulk, single = LocalRom(data), LocalRom(data)
+            bulk.write_words(0x40, values, stride)
+            for i, value in enumerate(values):
+                single.write_word(0x40 + stride * i, value)
+            self.assertEqual(bytes(bulk), bytes(single))
+
+        for stride in (2, 6, 12):
+            values = [rng.getrandbits(16) for _ in range(20)]
+            bulk, single = LocalRom(data), LocalRom(data)
+            bulk.write_halfwords(0x40, values, stride)
+            for i, value in enumerate(values):
+                single.write_halfword(0x40 + stride * i, value)
+            self.assertEqual(bytes(bulk), bytes(single))
+
+
+class TestRomHash(TestBase):
+    def test_hash_cached_until_file_changes(self):
+        """Test that a file's hash is reused until its size or modification time changes"""
+        storage = {}
+        def persistent_store(category, key, value):
+            storage.setdefault(category, {})[key] = value
+
+        with tempfile.TemporaryDirectory() as directory, \
+             mock.patch('Utils.persistent_load', return_value=storage), \
+             mock.patch('Utils.persistent_store', persistent_store):
+            path = Path(directory, 'rom.gba')
+            path.write_bytes(b'rom')
+            stat = path.stat()
+            self.assertEqual(get_file_md5(path, stat, b'rom'), hashlib.md5(b'rom').hexdigest())
+            # Wrong contents, but the file looks unchanged, so they aren't hashed
+            self.assertEqual(get_file_md5(path, stat, b'not rom'), hashlib.md5(b'rom').hexdigest())
+
+            path.write_bytes(b'new rom')
+            self.assertEqual(get_file_md5(path, path.stat(), b'new rom'), hashlib.md5(b'new rom').hexdigest())
+
+
+class TestPatchDeterminism(TestBase):
+    def test_steps_give_same_rom(self):
+        """Test that the Wario Land 4 patch steps only depend on the patch, so patched ROMs can be cached"""
+        self.addCleanup(random.setstate, random.getstate())
+        rom = bytearray(random.Random(0).randbytes(8 * 1024 * 1024))
+        rom[0xA0:0xAC] = b'WARIOLANDE\0\0'
+        rom = bytes(rom)
+        caller = SimpleNamespace(files={SHUFFLE_SEED_FILE: (12345).to_bytes(4, 'little')})
+        for music in range(MusicShuffle.option_disabled + 1):
+            patched = set()
+            for global_seed in range(3):
+                random.seed(global_seed)
+                data = WL4PatchExtensions.update_header(caller, rom)
+                data = WL4PatchExtensions.copy_medal_gfx(caller, data)
+                data = WL4PatchExtensions.shuffle_music_and_wario_voice(caller, data, music, True)
+                patched.add(bytes(data))
+            self.assertEqual(len(patched), 1, f'music_shuffle: {music}')
+
+
+class TestPatchedRomCache(TestBase):
+    def test_cache(self):
+        """Test cache hits, misses, and least recently used eviction"""
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            patch_path = directory / 'patch.apwl4'
+            patch_path.write_bytes(b'patch')
+            cache = PatchedRomCache(directory / 'cache', 25)
+            key = cache.get_key(patch_path, 'base md5', '1')
+            self.assertNotEqual(key, cache.get_key(patch_path, 'other base md5', '1'))
+            self.assertNotEqual(key, cache.get_key(patch_path, 'base md5', '2'))
+
+            target = directory / 'out.gba'
+            self.assertFalse(cache.get(key, target))
+            target.write_bytes(b'0' * 10)
+            cache.put(key, target)
+            target.unlink()
+            self.assertTrue(cache.get(key, target))
+            self.assertEqual(target.read_bytes(), b'0' * 10)
+
+            target.write_bytes(b'1' * 10)
+            cache.put('b', target)
+            os.utime(cache.get_path(key), ns=(1_000_000_000, 1_000_000_000))
+            os.utime(cache.get_path('b'), ns=(2_000_000_000, 2_000_000_000))
+            # Using the first ROM again keeps it over the second
+            self.assertTrue(cache.get(key, directory / 'again.gba'))
+            target.write_bytes(b'2' * 10)
+            cache.put('c', target)
+            self.assertTrue(cache.get_path(key).exists())
+            self.assertFalse(cache.get_path('b').exists())
+            self.assertTrue(cache.get_path('c').exists())
+
+    def test_cache_hit_reads_patch(self):
+        """Test that a ROM from the cache still gets the server and slot from the patch file"""
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            patch_path = directory / 'patch.apwl4'
+            WL4ProcedurePatch(player=1, player_name='Wario', server='localhost:38281').write(str(patch_path))
+            rom_path = directory / 'base.gba'
+            rom_path.write_bytes(b'rom')
+            cache = PatchedRomCache(directory / 'cache', 1024)
+            cache.put(cache.get_key(patch_path, 'base md5', str(WL4ProcedurePatch.steps_version)), rom_path)
+
+            patch = WL4ProcedurePatch(str(patch_path))
+            rom_module = WL4ProcedurePatch.__module__
+            with mock.patch(f'{rom_module}.get_patched_rom_cache', return_value=cache), \
+                 mock.patch(f'{rom_module}.get_base_rom_path', return_value=rom_path), \
+                 mock.patch(f'{rom_module}.get_file_md5', return_value='base md5'):
+                patch.patch(str(directory / 'out.gba'))
+            self.assertEqual((directory / 'out.gba').read_bytes(), b'rom')
+            self.assertEqual(patch.server, 'localhost:38281')
+            self.assertEqual(patch.player, 1)
+            self.assertEqual(patch.player_name, 'Wario')
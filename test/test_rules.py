@@ -0,0 +1,52 @@
+from BaseClasses import CollectionState
+
+from . import WL4TestBase
+from ..options import Difficulty, Goal, Logic
+from ..rules import (ABILITY_STATE, GOLDEN_TREASURE_COUNT, And, Has, Or, ability_state_index, advanced_logic,
+                     difficulty, get_truth_table, golden_treasures, has, jewel_counts, not_difficulty)
+
+
+class TestDerivedItems(WL4TestBase):
+    options = {'goal': Goal.option_golden_diva_treasure_hunt}
+
+    def assert_derived_items(self, state: CollectionState):
+        prog_items = state.prog_items[self.player]
+        self.assertEqual(prog_items[ABILITY_STATE], ability_state_index(prog_items))
+        self.assertEqual(prog_items[GOLDEN_TREASURE_COUNT], sum(1 for item in golden_treasures if prog_items[item]))
+        for key, pieces in jewel_counts.items():
+            self.assertEqual(prog_items[key], min(prog_items[piece] for piece in pieces), key)
+
+    def test_collect_and_remove(self):
+        """Test that derived counts stay correct as items are collected and removed"""
+        state = CollectionState(self.multiworld)
+        items = [item for item in self.multiworld.itempool if item.player == self.player and item.advancement]
+        for item in items:
+            state.collect(item, True)
+            self.assert_derived_items(state)
+        for item in reversed(items):
+            state.remove(item)
+            self.assert_derived_items(state)
+        self.assertEqual(+state.prog_items[self.player], {})
+
+
+class TestOptionFolding(WL4TestBase):
+    options = {'difficulty': Difficulty.option_hard, 'logic': Logic.option_basic}
+
+    def test_fold_options(self):
+        """Test that option checks are replaced by their result for the world"""
+        world = self.multiworld.worlds[self.player]
+        requirement = has('Ground Pound') | advanced_logic() & has('Grab')
+        self.assertEqual(repr(requirement.fold_options(world).node), repr(Has('Progressive Ground Pound', 1)))
+        self.assertTrue((difficulty(Difficulty.option_hard) | has('Swim')).fold_options(world).is_always(True))
+        self.assertTrue((not_difficulty(Difficulty.option_hard) & has('Swim')).fold_options(world).is_always(False))
+
+
+class TestTruthTables(WL4TestBase):
+    def test_node_types_kept_apart(self):
+        """Test that nodes with the same operands but different types don't share a table"""
+        world = self.multiworld.worlds[self.player]
+        operands = (Has('Swim', 1), Has('Stomp Jump', 1))
+        all_table = get_truth_table(And(operands), world)
+        any_table = get_truth_table(Or(operands), world)
+        self.assertNotEqual(all_table, any_table)
+        self.assertEqual(sum(any_table), 3 * sum(all_table))